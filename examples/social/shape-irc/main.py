@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 """
-An IRC bot that connects to an IRC server, joins a channel, and responds to messages using the Shapes LLM API.
+An IRC bot that connects to one or more IRC servers, joins channels, and responds to messages using the Shapes LLM API.
 """
 
-import irc.bot
+import irc.client_aio
 import irc.strings
 import ssl
 import time
@@ -16,12 +16,33 @@ import aiohttp
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
+from outgoing import SendQueue
+from triggers import STATS_INTERVAL, TriggerRules
 
 # Load environment variables from .env file
 load_dotenv()
 
-class IRCBot(irc.bot.SingleServerIRCBot):
-    def __init__(self, nickname, server, channel, port=6697):
+SHAPES_API_BASE_URL = "https://api.shapes.inc/v1"
+
+# Seconds to wait before reconnecting after a disconnect, doubling up to the maximum
+RECONNECT_MIN_DELAY = 2
+RECONNECT_MAX_DELAY = 300
+
+class IRCBot(irc.client_aio.AioSimpleIRCClient):
+    """
+    One bot per IRC network, joining any number of channels on it.
+
+    The bot runs on a single asyncio event loop: IRC traffic (including PING/PONG)
+    keeps being handled while replies are generated, and each message is answered
+    in its own task, so several can be in flight at once. Bots for several networks
+    can run on the same loop and share one Shapes API client (see run_bot).
+
+    Create it from a coroutine, so it picks up the running loop.
+    """
+
+    def __init__(self, nickname, server, channels, port=6697, aclient_shape=None, triggers=None):
+        irc.client_aio.AioSimpleIRCClient.__init__(self)
+
         # Initialize OpenAI client for Shapes API
         self.shape_api_key = os.getenv("SHAPESINC_API_KEY")
         self.shape_username = nickname
@@ -29,31 +50,88 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         if not self.shape_api_key:
             print("Warning: SHAPESINC_API_KEY not found in .env")
         
-        self.api_base_url = "https://api.shapes.inc/v1"
-            
-        self.aclient_shape = AsyncOpenAI(
+        self.api_base_url = SHAPES_API_BASE_URL
+
+        # A client passed in is shared with other bots (one HTTP connection pool) and closed by its owner
+        self.owns_client = aclient_shape is None
+        self.aclient_shape = aclient_shape or AsyncOpenAI(
             api_key=self.shape_api_key,
             base_url=self.api_base_url,
         )
-        # Create SSL wrapper for the socket
-        ssl_context = ssl.create_default_context()
-        factory = irc.connection.Factory(wrapper=lambda sock: ssl_context.wrap_socket(sock, server_hostname=server))
-        
-        # Initialize the bot
-        irc.bot.SingleServerIRCBot.__init__(
-            self, 
-            [(server, port)], 
-            nickname, 
-            nickname,
-            connect_factory=factory
+        # TLS is handled by the event loop's transport
+        self.connect_factory = irc.connection.AioFactory(ssl=ssl.create_default_context())
+        self.server = server
+        self.port = port
+        self.nickname = nickname
+        self.channels = list(channels)
+
+        # Which messages get a reply at all is decided before any API call
+        self.triggers = triggers or TriggerRules()
+
+        # Replies are split into lines that fit IRC's 512-byte limit and paced to avoid flood kicks
+        self.send_queue = SendQueue(self.connection)
+        self.reply_tasks = set()
+        self.reconnect_delay = RECONNECT_MIN_DELAY
+        self.reconnect_task = None
+        self.shutting_down = False
+
+    async def run(self):
+        """Connect and keep the bot running until the task is cancelled."""
+        print(f"Connecting to {self.server}:{self.port} as {self.nickname}...")
+        try:
+            await self.connect_to_server()
+        except OSError as e:
+            # Keep retrying in the background rather than stopping bots on other networks
+            print(f"Error connecting to {self.server}: {e}")
+            self.start_reconnect()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.shutting_down = True
+            if self.reconnect_task is not None:
+                self.reconnect_task.cancel()
+            self.connection.disconnect("Bot shutting down...")
+            if self.owns_client:
+                await self.aclient_shape.close()
+
+    async def connect_to_server(self):
+        await self.connection.connect(
+            self.server,
+            self.port,
+            self.nickname,
+            connect_factory=self.connect_factory,
         )
-        
-        self.channel = channel
-        
+
+    def start_reconnect(self):
+        """Start the reconnect loop, unless it is already running."""
+        # The running loop checks the connection again after each attempt, so a
+        # disconnect while it is running needs no second loop
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = self.reactor.loop.create_task(self.reconnect())
+
+    async def reconnect(self):
+        """Reconnect with exponential backoff until it succeeds."""
+        while not self.shutting_down and not self.connection.is_connected():
+            print(f"Reconnecting in {self.reconnect_delay} seconds...")
+            await asyncio.sleep(self.reconnect_delay)
+            self.reconnect_delay = min(self.reconnect_delay * 2, RECONNECT_MAX_DELAY)
+            try:
+                await self.connect_to_server()
+            except OSError as e:
+                print(f"Reconnect failed: {e}")
+
+    def on_disconnect(self, connection, event):
+        """Called when the connection to the server is lost."""
+        print(f"Disconnected from {self.server}")
+        if not self.shutting_down:
+            self.start_reconnect()
+
     def on_welcome(self, connection, event):
         """Called when the bot successfully connects to the server."""
         print(f"Connected to {connection.get_server_name()}")
-        connection.join(self.channel)
+        self.reconnect_delay = RECONNECT_MIN_DELAY
+        for channel in self.channels:
+            connection.join(channel)
         
     def on_join(self, connection, event):
         """Called when the bot joins a channel."""
@@ -65,24 +143,38 @@ class IRCBot(irc.bot.SingleServerIRCBot):
         """Called when a message is received in a channel."""
         message = event.arguments[0]
         sender = event.source.nick
+        channel = event.target
         
         # Don't respond to our own messages
         if sender == connection.get_nickname():
             return
             
-        print(f"Message from {sender}: {message}")
-        
-        # Generate a response using the LLM
-        response = asyncio.run(self.generate_llm_response(sender, message))
+        text = self.triggers.evaluate(self.server, connection.get_nickname(), sender, message)
+        if text is None:
+            return
+
+        print(f"Message from {sender} in {channel}: {message}")
         
+        # Generate the response in its own task; the event loop keeps handling IRC traffic meanwhile
+        task = self.reactor.loop.create_task(self.respond(channel, sender, text))
+        self.reply_tasks.add(task)
+        task.add_done_callback(self.reply_tasks.discard)
+
+    async def respond(self, channel, sender, message):
+        """Generate a response using the LLM and send it to the channel."""
+        response = await self.generate_llm_response(channel, sender, message)
+
         if response:
-            # Clean the response by replacing newlines and carriage returns with spaces
-            clean_response = response.replace('\n', ' ').replace('\r', ' ')
-            print(f"Sending to IRC: {clean_response}")
-            # Send the response to the channel
-            connection.privmsg(self.channel, clean_response)
-            
-    async def generate_llm_response(self, sender, message):
+            print(f"Sending to {channel}: {response}")
+            # Queue the response for the channel, one IRC line per line of the reply;
+            # each channel is paced separately
+            self.send_queue.send(channel, response)
+
+    def channel_id(self, channel):
+        """The X-Channel-Id for a channel: the same channel name on two networks is two conversations."""
+        return f"{self.server}/{irc.strings.lower(channel)}"
+
+    async def generate_llm_response(self, channel, sender, message):
         """Generate a response using the Shapes LLM API."""
         try:
             if not self.shape_api_key or not self.shape_username:
@@ -102,7 +194,7 @@ class IRCBot(irc.bot.SingleServerIRCBot):
                 messages=messages,
                 extra_headers={
                     "X-User-Id": sender,  # Use the IRC nickname as the user ID
-                    "X-Channel-Id": self.channel,  # Use the IRC channel name
+                    "X-Channel-Id": self.channel_id(channel),  # Use the network and channel name
                 },
             )
             
@@ -145,20 +237,68 @@ async def get_shape_name(api_key):
         print(f"Error fetching shape name: {e}")
         return None
 
+def parse_channels(value):
+    """Split a comma-separated channel list, adding the # prefix where none is given."""
+    channels = []
+    for channel in value.split(","):
+        channel = channel.strip()
+        if channel:
+            channels.append(channel if channel[0] in "#&+!" else f"#{channel}")
+    return channels
+
+def parse_network(spec, default_port):
+    """Parse a --network value: SERVER[:PORT]=CHANNEL[,CHANNEL...]"""
+    address, _, channels = spec.partition("=")
+    server, _, port = address.partition(":")
+    if not server or not channels:
+        raise argparse.ArgumentTypeError(f"Invalid network {spec!r}, expected SERVER[:PORT]=CHANNEL[,CHANNEL...]")
+    return server, int(port) if port else default_port, parse_channels(channels)
+
+async def run_bot(nickname, networks):
+    """Run a bot for each (server, port, channels) network on this event loop, sharing one API client."""
+    aclient_shape = AsyncOpenAI(
+        api_key=os.getenv("SHAPESINC_API_KEY"),
+        base_url=SHAPES_API_BASE_URL,
+    )
+    triggers = TriggerRules()
+    bots = [IRCBot(nickname, server, channels, port, aclient_shape, triggers) for server, port, channels in networks]
+    stats = asyncio.create_task(print_trigger_stats(triggers))
+    try:
+        await asyncio.gather(*(bot.run() for bot in bots))
+    finally:
+        stats.cancel()
+        print(triggers.summary())
+        await aclient_shape.close()
+
+async def print_trigger_stats(triggers):
+    """Print how many messages were answered and skipped, every STATS_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        print(triggers.summary())
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='IRC bot that uses Shapes LLM API')
-    parser.add_argument('--channel', required=True, help='IRC channel to join (without # prefix)')
-    parser.add_argument('--server', required=True, help='IRC server to connect to')
+    parser.add_argument('--channel', help='IRC channel(s) to join on --server, comma-separated (# prefix optional)')
+    parser.add_argument('--server', help='IRC server to connect to')
+    parser.add_argument('--network', action='append', default=[], metavar='SERVER[:PORT]=CHANNELS',
+                        help='Another server and its comma-separated channels; can be repeated')
     parser.add_argument('--shape', help='Shape name to use (will be used as nickname)')
     parser.add_argument('--port', type=int, default=6697, help='IRC server port (default: 6697 for SSL)')
     
     args = parser.parse_args()
     
-    # Add the # prefix if not provided
-    channel = args.channel
-    if not channel.startswith("#"):
-        channel = f"#{channel}"
+    networks = []
+    if args.server or args.channel:
+        if not (args.server and args.channel):
+            parser.error("--server and --channel must be given together")
+        networks.append((args.server, args.port, parse_channels(args.channel)))
+    try:
+        networks += [parse_network(spec, args.port) for spec in args.network]
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    if not networks:
+        parser.error("give --server and --channel, or at least one --network")
     
     # Get the API key from environment
     api_key = os.getenv("SHAPESINC_API_KEY")
@@ -178,16 +318,10 @@ def main():
             sys.exit(1)
         print(f"Using shape name: {nickname}")
     
-    server = args.server
-    port = args.port
-    
-    bot = IRCBot(nickname, server, channel, port)
     try:
-        print(f"Connecting to {server}:{port} as {nickname}...")
-        bot.start()
+        asyncio.run(run_bot(nickname, networks))
     except KeyboardInterrupt:
         print("Bot shutting down...")
-        bot.disconnect()
     except Exception as e:
         print(f"Error: {e}")
 
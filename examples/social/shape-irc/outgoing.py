@@ -0,0 +1,122 @@
+"""
+Outgoing IRC messages: splitting replies into lines that fit the protocol limit,
+and pacing them so the server doesn't disconnect the bot for flooding.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+# RFC 2812: a line is at most 512 bytes including the trailing CR LF
+IRC_LINE_BYTES = 512
+
+# Room for the ":nick!user@host " prefix the server adds when relaying our line
+# to others (user is at most 10 characters, host at most 63), besides the nick itself
+SOURCE_PREFIX_BYTES = 1 + 1 + 10 + 1 + 63 + 1
+
+
+def max_text_bytes(nickname, target):
+    """Bytes of text a PRIVMSG to target can carry without being cut off when relayed."""
+    overhead = len(f"PRIVMSG {target} :\r\n".encode()) + len(nickname.encode()) + SOURCE_PREFIX_BYTES
+    return IRC_LINE_BYTES - overhead
+
+
+def split_message(text, max_bytes):
+    """
+    Split text into IRC lines of at most max_bytes UTF-8 bytes.
+
+    Newlines in the text start a new line (blank lines are dropped). Longer lines
+    are broken at the last space that fits, or mid-word if a word is too long,
+    never inside a multi-byte character.
+    """
+    lines = []
+    for paragraph in text.replace("\r", "").split("\n"):
+        data = paragraph.strip().encode("utf-8")
+        while len(data) > max_bytes:
+            cut = data.rfind(b" ", 0, max_bytes + 1)
+            if cut <= 0:
+                cut = max_bytes
+                # Step back over UTF-8 continuation bytes (0b10xxxxxx) to a character boundary
+                while cut > 0 and data[cut] & 0xC0 == 0x80:
+                    cut -= 1
+            lines.append(data[:cut].decode("utf-8"))
+            data = data[cut:].lstrip(b" ")
+        if data:
+            lines.append(data.decode("utf-8"))
+    return lines
+
+
+class TokenBucket:
+    """Allows bursts of up to `burst` lines, refilled at `rate` lines per second."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def take(self):
+        """Wait until a token is available, then use it."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendQueue:
+    """
+    Paces PRIVMSG lines on one IRC connection.
+
+    Each target (channel or nick) has its own FIFO queue and token bucket, so one
+    long reply doesn't hold up others; all lines also go through a bucket for the
+    whole connection, which is what server flood limits apply to. A target has a
+    sending task only while it has lines queued. Lines queued while disconnected
+    are sent after reconnecting.
+    """
+
+    def __init__(self, connection, rate=None, burst=None, target_rate=None, target_burst=None):
+        self.connection = connection
+        self.target_rate = target_rate or float(os.getenv("IRC_TARGET_RATE", 0.5))
+        self.target_burst = target_burst or int(os.getenv("IRC_TARGET_BURST", 4))
+        self.bucket = TokenBucket(
+            rate or float(os.getenv("IRC_SEND_RATE", 1.0)),
+            burst or int(os.getenv("IRC_SEND_BURST", 5)),
+        )
+        self._queues = {}
+        self._buckets = {}
+        self._tasks = {}
+
+    def send(self, target, text):
+        """Split text into lines and queue them for target."""
+        lines = split_message(text, max_text_bytes(self.connection.get_nickname(), target))
+        if not lines:
+            return
+        self._queues.setdefault(target, deque()).extend(lines)
+        if target not in self._tasks:
+            self._tasks[target] = asyncio.get_running_loop().create_task(self._drain(target))
+
+    def pending(self, target=None):
+        """Lines still queued, for one target or all of them."""
+        if target is not None:
+            return len(self._queues.get(target, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def _drain(self, target):
+        queue = self._queues[target]
+        bucket = self._buckets.setdefault(target, TokenBucket(self.target_rate, self.target_burst))
+        try:
+            while queue:
+                await bucket.take()
+                await self.bucket.take()
+                while not self.connection.is_connected():
+                    await asyncio.sleep(1)
+                self.connection.privmsg(target, queue.popleft())
+        finally:
+            # Nothing awaits between finding the queue empty and these deletes, so no line is lost
+            del self._queues[target]
+            del self._tasks[target]
@@ -0,0 +1,100 @@
+"""
+Trigger rules: decide, before any API call, which channel messages the bot answers.
+"""
+
+import os
+import random
+import re
+import time
+
+import irc.strings
+
+# How often run_bot prints the trigger counters, in seconds
+STATS_INTERVAL = 600
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+class TriggerRules:
+    """
+    A message is answered if it mentions the bot's nick, starts with the command
+    prefix, or wins a random draw at the reply probability; and the sender hasn't
+    had a reply within the cooldown. Everything else is counted and skipped without
+    calling the Shapes API.
+
+    Configured with IRC_TRIGGER_MENTION (default on), IRC_TRIGGER_PREFIX (e.g. "!ask",
+    default none), IRC_REPLY_PROBABILITY (0 to 1, default 0) and IRC_USER_COOLDOWN
+    (seconds, default 5).
+    """
+
+    def __init__(self, mention=None, prefix=None, probability=None, cooldown=None):
+        self.mention = mention if mention is not None else env_flag("IRC_TRIGGER_MENTION", "true")
+        self.prefix = prefix if prefix is not None else os.getenv("IRC_TRIGGER_PREFIX", "")
+        self.probability = probability if probability is not None else float(os.getenv("IRC_REPLY_PROBABILITY", 0))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("IRC_USER_COOLDOWN", 5))
+
+        self._mention_patterns = {}
+        self._last_reply = {}
+        self.counters = {"generated": 0, "skipped_untriggered": 0, "skipped_cooldown": 0}
+
+    def evaluate(self, network, nickname, sender, message):
+        """
+        Decide whether to answer a channel message.
+
+        Returns the text to send to the Shapes API (with the command prefix or a
+        leading "nick:" removed), or None to skip the message.
+        """
+        text = self._triggered(nickname, message)
+        if text is None:
+            self.counters["skipped_untriggered"] += 1
+            return None
+
+        key = (network, irc.strings.lower(sender))
+        now = time.monotonic()
+        last = self._last_reply.get(key)
+        if last is not None and now - last < self.cooldown:
+            self.counters["skipped_cooldown"] += 1
+            return None
+        self._last_reply[key] = now
+        if len(self._last_reply) > 10000:
+            self._last_reply = {k: t for k, t in self._last_reply.items() if now - t < self.cooldown}
+
+        self.counters["generated"] += 1
+        return text
+
+    def _triggered(self, nickname, message):
+        if self.prefix and message.startswith(self.prefix):
+            return message[len(self.prefix):].strip() or None
+
+        if self.mention:
+            match = self._mention_pattern(nickname).search(message)
+            if match:
+                # "nick: question" -> "question"; a mention mid-sentence is kept as written
+                if match.start() == 0:
+                    return message[match.end():].lstrip(":, ").strip() or message
+                return message
+
+        if self.probability and random.random() < self.probability:
+            return message
+        return None
+
+    def _mention_pattern(self, nickname):
+        # The nick as a whole word; nicks may contain characters like - [ ] \ ` ^ { } |
+        pattern = self._mention_patterns.get(nickname)
+        if pattern is None:
+            pattern = re.compile(rf"(?<![\w\-\[\]\\`^{{}}|]){re.escape(nickname)}(?![\w\-\[\]\\`^{{}}|])", re.I)
+            self._mention_patterns[nickname] = pattern
+        return pattern
+
+    def summary(self):
+        """One line with the counters and the share of messages that reached the API."""
+        total = sum(self.counters.values())
+        share = self.counters["generated"] / total * 100 if total else 0.0
+        return (
+            f"Trigger stats: {self.counters['generated']} generated, "
+            f"{self.counters['skipped_untriggered']} skipped (not addressed), "
+            f"{self.counters['skipped_cooldown']} skipped (cooldown); "
+            f"{share:.1f}% of {total} messages sent to the API"
+        )
@@ -0,0 +1,205 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+
+class AttachmentCache:
+    """
+    On-disk, size-bounded cache of extracted attachment text.
+
+    Entries are keyed by the SHA-256 of the attachment content, so the same PDF
+    forwarded around a thread is parsed once. Aliases (e.g. the download URL or
+    ETag) point at a content key, letting a repeat skip the download as well.
+    When the cache grows past its size limit the least recently used files are
+    evicted, using file modification times as the recency order.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        Initialize the AttachmentCache.
+
+        Args:
+            directory (str, optional): Where cache files live. Defaults to ATTACHMENT_CACHE_DIR
+                                       or a "shape-mail-cache" folder in the temp directory.
+            max_bytes (int, optional): Total size limit of the cache. Defaults to
+                                       ATTACHMENT_CACHE_MAX_BYTES or 256 MB.
+        """
+        self.directory = directory or os.getenv(
+            "ATTACHMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "shape-mail-cache")
+        )
+        self.max_bytes = max_bytes or int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in self._cache_files())
+
+    def get(self, key):
+        """
+        Look up extracted text by content key, counting a hit or a miss.
+
+        Args:
+            key (str): The content key (see AttachmentExtractor)
+
+        Returns:
+            str or None: The cached text, or None if it isn't cached
+        """
+        text = self._read(self._entry_path(key))
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def get_alias(self, alias):
+        """
+        Look up extracted text through an alias such as a URL or ETag.
+
+        Only hits are counted: a missing alias falls back to a content key lookup,
+        which counts the miss.
+
+        Args:
+            alias (str): The alias string
+
+        Returns:
+            str or None: The cached text, or None if the alias or its entry isn't cached
+        """
+        key = self._read(self._alias_path(alias))
+        if key is None:
+            return None
+
+        text = self._read(self._entry_path(key))
+        if text is not None:
+            with self._lock:
+                self.hits += 1
+        return text
+
+    def put(self, key, text, aliases=()):
+        """
+        Store extracted text under its content key, plus any aliases.
+
+        Args:
+            key (str): The content key
+            text (str): The extracted text
+            aliases (iterable, optional): Alias strings that should resolve to this key
+        """
+        self._write(self._entry_path(key), text)
+        self.put_aliases(key, aliases)
+        self._evict()
+
+    def put_aliases(self, key, aliases):
+        """
+        Point more aliases at an already cached content key.
+
+        Args:
+            key (str): The content key
+            aliases (iterable): Alias strings that should resolve to this key
+        """
+        for alias in aliases:
+            self._write(self._alias_path(alias), key)
+
+    def stats(self):
+        """Return the hit/miss counters and the cache size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
+
+    def _cache_files(self):
+        """
+        The entry and alias files in the directory, without the temp files of writes
+        in progress (deleting one of those would make that write fail).
+        """
+        return [
+            entry for entry in os.scandir(self.directory)
+            if not entry.name.endswith(".tmp") and entry.is_file()
+        ]
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _alias_path(self, alias):
+        return os.path.join(self.directory, hashlib.sha256(alias.encode("utf-8")).hexdigest() + ".ref")
+
+    def _read(self, path):
+        """Read a cache file and mark it as recently used, or return None if it's missing."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"Error reading attachment cache file {path}: {str(e)}")
+            return None
+
+    def _write(self, path, text):
+        """Write a cache file atomically, so concurrent workers never see half an entry."""
+        data = text.encode("utf-8")
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Error writing attachment cache file {path}: {str(e)}")
+            return
+        with self._lock:
+            self._size += len(data) - previous_size
+
+    def _evict(self):
+        """Delete the least recently used files until the cache fits in max_bytes."""
+        with self._lock:
+            if self._size <= self.max_bytes:
+                return
+
+            # Other processes may share the directory, so work from what's actually on disk
+            entries = []
+            for entry in self._cache_files():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed by another process in the meantime
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            self._size = sum(size for _, size, _ in entries)
+
+            for _, size, path in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._size -= size
+                except OSError:
+                    pass
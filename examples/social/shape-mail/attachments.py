@@ -0,0 +1,483 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+import PyPDF2
+import requests
+from requests.adapters import HTTPAdapter
+
+from attachment_cache import AttachmentCache
+from prompt_budget import format_attachment
+
+# Attachment types whose text we pass on to the shape
+TEXT_CONTENT_TYPES = (
+    "text/",
+    "application/pdf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument",
+)
+
+# Office Open XML parts that hold the document text (Word, PowerPoint, Excel)
+OFFICE_TEXT_PARTS = ("word/document.xml", "ppt/slides/slide", "xl/sharedStrings.xml")
+
+
+def open_source(source):
+    """Open attachment content that is either in memory (bytes) or spooled to disk (path)."""
+    if isinstance(source, str):
+        return open(source, "rb")
+    return io.BytesIO(source)
+
+
+def truncate_text(text, max_chars):
+    """Cut text down to max_chars, noting that it was truncated."""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n[Truncated: attachment is longer than {max_chars} characters]"
+
+
+def iter_pdf_pages(source, max_pages, max_chars):
+    """
+    Lazily yield the text of a PDF's pages until the page or character budget runs out.
+
+    Pages are only parsed as they are consumed, so a 500-page PDF costs no more
+    than its first max_pages pages.
+
+    Args:
+        source (bytes or str): The raw PDF, or the path of a spooled temp file
+        max_pages (int): Maximum number of pages to read
+        max_chars (int): Maximum number of characters to yield in total
+
+    Yields:
+        str: The text of each page, followed by a truncation note if a budget ran out
+    """
+    with open_source(source) as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        page_count = len(pdf_reader.pages)
+        remaining = max_chars
+
+        for page_num in range(page_count):
+            if page_num >= max_pages:
+                yield f"[Truncated: only the first {max_pages} of {page_count} pages were read]"
+                return
+
+            page_text = pdf_reader.pages[page_num].extract_text() or ""
+            if len(page_text) > remaining:
+                yield page_text[:remaining]
+                yield f"[Truncated: attachment is longer than {max_chars} characters]"
+                return
+
+            remaining -= len(page_text)
+            yield page_text
+
+
+def extract_pdf_text(source, max_pages, max_chars):
+    """
+    Extract the text of a PDF within a page and character budget.
+
+    Runs in a worker process, so it must stay a plain module-level function.
+
+    Args:
+        source (bytes or str): The raw PDF, or the path of a spooled temp file
+        max_pages (int): Maximum number of pages to read
+        max_chars (int): Maximum number of characters to return
+
+    Returns:
+        str: The text of the pages read, separated by blank lines
+    """
+    # Join once at the end instead of growing a string page by page
+    return "\n\n".join(iter_pdf_pages(source, max_pages, max_chars))
+
+
+def extract_office_text(source, max_chars):
+    """
+    Extract the text of an Office Open XML document (.docx, .pptx, .xlsx).
+
+    Runs in a worker process, so it must stay a plain module-level function.
+    Files that are not zip archives (e.g. legacy .doc) are decoded as text.
+
+    Args:
+        source (bytes or str): The raw document, or the path of a spooled temp file
+        max_chars (int): Maximum number of characters to return
+
+    Returns:
+        str: The text of the document
+    """
+    with open_source(source) as document:
+        try:
+            archive = zipfile.ZipFile(document)
+        except zipfile.BadZipFile:
+            document.seek(0)
+            return read_text(document, max_chars)
+
+        paragraphs = []
+        with archive:
+            for name in sorted(archive.namelist()):
+                if not name.startswith(OFFICE_TEXT_PARTS):
+                    continue
+                root = ElementTree.fromstring(archive.read(name))
+                paragraphs.append(" ".join(text.strip() for text in root.itertext() if text.strip()))
+        return truncate_text("\n".join(paragraphs), max_chars)
+
+
+def read_text(file, max_chars):
+    """Decode a text file as UTF-8, reading no more than the character budget needs."""
+    # UTF-8 is at most 4 bytes per character, so this always covers max_chars
+    data = file.read(max_chars * 4 + 1)
+    return truncate_text(data.decode("utf-8", errors="ignore"), max_chars)
+
+
+def etag_alias(url, etag, variant):
+    """
+    Cache alias for an attachment's ETag.
+
+    An ETag only identifies a version of one resource, and different servers can
+    hand out the same ETag for different files, so it is scoped to the URL.
+    """
+    return f"etag|{url}|{etag}|{variant}"
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when an attachment exceeds the configured size cap."""
+    pass
+
+
+class CachedAttachment(Exception):
+    """Raised when an attachment turns out to be cached part way through fetching it."""
+
+    def __init__(self, text):
+        super().__init__("attachment text is cached")
+        self.text = text
+
+
+class AttachmentExtractor:
+    """
+    Downloads Mailgun attachments concurrently and extracts their text.
+
+    Downloads share one pooled HTTP session and run on a thread pool, while the
+    CPU-bound PDF and Office parsing runs on a process pool so it doesn't hold
+    the GIL. Each attachment has a size cap and a time budget, so one huge or
+    slow attachment can't hold up the whole reply. Extracted text is cached by
+    content hash, so attachments repeated across a thread are parsed once.
+    """
+
+    def __init__(self, max_bytes=None, timeout=None, workers=None,
+                 spool_bytes=None, max_pages=None, max_chars=None):
+        """
+        Initialize the AttachmentExtractor.
+
+        Args:
+            max_bytes (int, optional): Largest attachment to download. Defaults to ATTACHMENT_MAX_BYTES or 10 MB.
+            timeout (float, optional): Seconds allowed per attachment. Defaults to ATTACHMENT_TIMEOUT or 20.
+            workers (int, optional): Concurrent downloads and extractions. Defaults to ATTACHMENT_WORKERS or 4.
+            spool_bytes (int, optional): Downloads larger than this are spooled to a temp file
+                                         instead of memory. Defaults to ATTACHMENT_SPOOL_BYTES or 1 MB.
+            max_pages (int, optional): PDF pages to read per attachment. Defaults to ATTACHMENT_MAX_PAGES or 50.
+            max_chars (int, optional): Characters of text to keep per attachment.
+                                       Defaults to ATTACHMENT_MAX_CHARS or 100,000.
+        """
+        self.max_bytes = max_bytes or int(os.getenv("ATTACHMENT_MAX_BYTES", 10 * 1024 * 1024))
+        self.timeout = timeout or float(os.getenv("ATTACHMENT_TIMEOUT", 20))
+        self.workers = workers or int(os.getenv("ATTACHMENT_WORKERS", 4))
+        self.spool_bytes = spool_bytes or int(os.getenv("ATTACHMENT_SPOOL_BYTES", 1024 * 1024))
+        self.max_pages = max_pages or int(os.getenv("ATTACHMENT_MAX_PAGES", 50))
+        self.max_chars = max_chars or int(os.getenv("ATTACHMENT_MAX_CHARS", 100000))
+
+        # Pooled session so attachment downloads reuse connections to Mailgun's storage
+        self.session = requests.Session()
+        self.session.auth = ("api", os.getenv("MAILGUN_API_KEY"))
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Extracted text cache, disabled with ATTACHMENT_CACHE_MAX_BYTES=0
+        self.cache = None
+        if os.getenv("ATTACHMENT_CACHE_MAX_BYTES") != "0":
+            self.cache = AttachmentCache()
+
+        self.download_pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._extract_pool_lock = threading.Lock()
+        self.extract_pool = self._new_extract_pool()
+
+    def _new_extract_pool(self):
+        """
+        Create the process pool that parses documents.
+
+        This process already runs threads (the web server, the email workers), and
+        forking while another thread holds a lock can deadlock the child, so workers
+        are started from a fresh process (forkserver, or spawn where unavailable).
+        """
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+
+    def extract(self, attachments):
+        """
+        Download and extract the text of all supported attachments.
+
+        Args:
+            attachments (list): Attachment dicts from Mailgun's "attachments" field
+
+        Returns:
+            str: The formatted text of every attachment, in the original order
+        """
+        futures = [
+            self.download_pool.submit(self._process, attachment)
+            for attachment in attachments
+            if self._is_supported(attachment)
+        ]
+        attachment_content = "".join(future.result() for future in futures)
+
+        if self.cache and futures:
+            logging.info(f"Attachment cache: {self.cache.stats()}")
+        return attachment_content
+
+    def _is_supported(self, attachment):
+        """Check whether an attachment is a named, non-image, text-bearing file."""
+        content_type = attachment.get("content-type", "")
+        return bool(attachment.get("name")) and content_type.startswith(TEXT_CONTENT_TYPES)
+
+    def _process(self, attachment):
+        """
+        Download one attachment and turn it into formatted text.
+
+        Args:
+            attachment (dict): The Mailgun attachment dict
+
+        Returns:
+            str: The formatted attachment block, or "" if it could not be downloaded
+        """
+        attachment_name = attachment.get("name", "")
+        content_type = attachment.get("content-type", "")
+        deadline = time.monotonic() + self.timeout
+
+        # Cached text depends on how it was extracted, not just on the file
+        variant = hashlib.sha1(
+            f"{content_type}|{self.max_pages}|{self.max_chars}".encode("utf-8")
+        ).hexdigest()[:12]
+        url_alias = f"url|{attachment.get('url', '')}|{variant}"
+
+        # Same URL (e.g. a webhook redelivery) means same content, skip the download entirely
+        if self.cache:
+            cached_text = self.cache.get_alias(url_alias)
+            if cached_text is not None:
+                return format_attachment(attachment_name, cached_text)
+
+        try:
+            source, digest, etag = self._download(attachment, deadline, variant)
+        except CachedAttachment as hit:
+            return format_attachment(attachment_name, hit.text)
+        except AttachmentTooLarge:
+            logging.warning(f"Skipping attachment {attachment_name}: larger than {self.max_bytes} bytes")
+            return format_attachment(
+                attachment_name, f"[Attachment skipped: larger than the {self.max_bytes} byte limit]"
+            )
+        except Exception as e:
+            logging.error(f"Error downloading attachment {attachment_name}: {str(e)}")
+            return ""
+
+        try:
+            # Same content seen before under another URL: one hash instead of a full parse
+            key = f"{digest}-{variant}"
+            aliases = [url_alias] + ([etag_alias(attachment.get("url", ""), etag, variant)] if etag else [])
+            if self.cache:
+                cached_text = self.cache.get(key)
+                if cached_text is not None:
+                    self.cache.put_aliases(key, aliases)
+                    return format_attachment(attachment_name, cached_text)
+
+            text, cacheable = self._extract(attachment_name, content_type, source, deadline)
+            if self.cache and cacheable:
+                self.cache.put(key, text, aliases)
+            return format_attachment(attachment_name, text)
+        finally:
+            # Large downloads were spooled to disk, clean them up once extracted
+            if isinstance(source, str):
+                os.remove(source)
+
+    def _extract(self, attachment_name, content_type, source, deadline):
+        """
+        Extract the text of downloaded attachment content.
+
+        Args:
+            attachment_name (str): The attachment's file name
+            content_type (str): The attachment's MIME type
+            source (bytes or str): The content, or the path of a spooled temp file
+            deadline (float): time.monotonic() value by which extraction must finish
+
+        Returns:
+            tuple: (text, cacheable), where cacheable is False for error placeholders
+        """
+        if content_type == "application/pdf":
+            try:
+                pdf_text = self._extract_in_process(
+                    extract_pdf_text, deadline, source, self.max_pages, self.max_chars
+                )
+                if pdf_text.strip():
+                    return pdf_text, True
+                return "[PDF contains no extractable text or contains only images]", True
+            except Exception as e:
+                logging.error(f"Error extracting text from PDF {attachment_name}: {str(e)}")
+                return f"[Error extracting PDF text: {str(e)}]", False
+
+        try:
+            if content_type.startswith("application/vnd.openxmlformats-officedocument"):
+                attachment_text = self._extract_in_process(
+                    extract_office_text, deadline, source, self.max_chars
+                )
+            else:
+                with open_source(source) as file:
+                    attachment_text = read_text(file, self.max_chars)
+            return attachment_text, True
+        except Exception as e:
+            return f"[Content could not be decoded: {str(e)}]", False
+
+    def _download(self, attachment, deadline, variant):
+        """
+        Stream an attachment from Mailgun's storage, enforcing the size cap and deadline.
+
+        Small attachments are kept in memory. Once a download grows past
+        spool_bytes it is written to a temp file instead, so large attachments
+        never sit in memory whole (or get copied to a worker process).
+
+        The content is hashed as it streams in, so cache lookups cost no extra pass.
+
+        Returns:
+            tuple: (content or temp file path, SHA-256 hex digest, ETag header or None)
+
+        Raises:
+            CachedAttachment: If the response's ETag is already cached (body is not read)
+            AttachmentTooLarge: If the attachment is bigger than max_bytes
+            TimeoutError: If the download runs past the deadline
+        """
+        # Mailgun reports the size up front, so oversized files are skipped without a request
+        if int(attachment.get("size") or 0) > self.max_bytes:
+            raise AttachmentTooLarge()
+
+        with self.session.get(attachment.get("url", ""), stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if int(response.headers.get("Content-Length") or 0) > self.max_bytes:
+                raise AttachmentTooLarge()
+
+            etag = response.headers.get("ETag")
+            if self.cache and etag:
+                cached_text = self.cache.get_alias(etag_alias(attachment.get("url", ""), etag, variant))
+                if cached_text is not None:
+                    raise CachedAttachment(cached_text)
+
+            digest = hashlib.sha256()
+            chunks = []
+            spool_file = None
+            size = 0
+            try:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AttachmentTooLarge()
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"download took longer than {self.timeout}s")
+                    digest.update(chunk)
+
+                    if spool_file is None and size > self.spool_bytes:
+                        spool_file = tempfile.NamedTemporaryFile(prefix="shape-mail-", delete=False)
+                        spool_file.writelines(chunks)
+                        chunks = []
+                    if spool_file is not None:
+                        spool_file.write(chunk)
+                    else:
+                        chunks.append(chunk)
+            except BaseException:
+                if spool_file is not None:
+                    spool_file.close()
+                    os.remove(spool_file.name)
+                raise
+
+            if spool_file is not None:
+                spool_file.close()
+                return spool_file.name, digest.hexdigest(), etag
+            return b"".join(chunks), digest.hexdigest(), etag
+
+    def _extract_in_process(self, function, deadline, *args):
+        """
+        Run an extraction function on the process pool, waiting until the deadline at most.
+
+        A parse that overruns keeps its worker busy even after we stop waiting, so on
+        a timeout the pool is replaced and its processes are killed. Jobs of other
+        threads that were running in the killed pool are retried once on the new one.
+        """
+        for attempt in range(2):
+            pool = self.extract_pool
+            try:
+                future = pool.submit(function, *args)
+                return future.result(timeout=max(deadline - time.monotonic(), 0.1))
+            except FuturesTimeoutError:
+                future.cancel()
+                self._recycle_extract_pool(pool, "a job overran its deadline")
+                # The futures TimeoutError has no message, and it ends up in the placeholder text
+                raise TimeoutError(f"extraction took longer than {self.timeout}s") from None
+            except BrokenProcessPool:
+                self._recycle_extract_pool(pool, "a worker process died")
+                if attempt or time.monotonic() >= deadline:
+                    raise
+
+    def _recycle_extract_pool(self, pool, reason):
+        """Replace the process pool (unless another thread already did) and kill its workers."""
+        with self._extract_pool_lock:
+            if self.extract_pool is not pool:
+                return
+            self.extract_pool = self._new_extract_pool()
+
+        # ProcessPoolExecutor has no public way to stop a running job, so terminate its processes
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        logging.warning(f"Restarted the attachment extraction pool: {reason}")
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_attachment_extractor():
+    """
+    Get the process-wide AttachmentExtractor, creating it on first use.
+
+    Created lazily so the environment (.env) is loaded before it reads its settings.
+    """
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = AttachmentExtractor()
+        return _extractor
@@ -0,0 +1,119 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# Benchmark the address helpers against the previous split/replace implementation.
+#
+# Builds large To/Cc headers (mixing "Name <email>", bare addresses, quoted names
+# with commas and duplicates in different case), times extract_cc_list from
+# helpers.py against the legacy version kept below, and reports where the two
+# disagree.
+#
+# Usage:
+#     python benchmark_helpers.py [--addresses N] [--repeat R]
+
+import argparse
+import random
+import timeit
+
+from helpers import extract_cc_list
+
+
+def legacy_get_name_email_pairing(email_string):
+    """The comma-splitting parser helpers.get_name_email_pairing used to be."""
+    email_list = email_string.split(",")
+    return_list = []
+    for email_item in email_list:
+        email_item = email_item.strip()
+        if "<" in email_item and ">" in email_item:
+            email_parts = email_item.split("<")
+            email = email_parts[-1].replace(">", "")
+            preceding_text = "<".join(email_parts[:-1]).strip()
+        else:
+            email = email_item
+            preceding_text = ""
+        preceding_text = preceding_text.replace('"', "")
+        preceding_text = preceding_text.replace("'", "")
+        return_list.append({"name": preceding_text, "email": email})
+    return return_list
+
+
+def legacy_extract_cc_list(email1, email2, remove1, remove2):
+    """The list-based extract_cc_list helpers.py used to have."""
+    email1_list = legacy_get_name_email_pairing(email1)
+    email2_list = legacy_get_name_email_pairing(email2)
+    remove1_list = legacy_get_name_email_pairing(remove1)
+    remove2_list = legacy_get_name_email_pairing(remove2)
+
+    black_list = [remove1_list[0]["email"], remove2_list[0]["email"]]
+    cc_list = []
+    for item in email1_list + email2_list:
+        email = item["email"]
+        name = item["name"]
+        if email not in black_list:
+            if name:
+                cc_list.append(f'"{name}" <{email}>')
+            else:
+                cc_list.append(email)
+    return cc_list
+
+
+def build_header(count, rng):
+    """Build an address header with count entries in assorted formats."""
+    entries = []
+    for i in range(count):
+        email = f"user{rng.randrange(count)}@example{i % 7}.com"
+        style = rng.randrange(4)
+        if style == 0:
+            entries.append(email)
+        elif style == 1:
+            entries.append(f"User {i} <{email}>")
+        elif style == 2:
+            entries.append(f'"Last{i}, First{i}" <{email}>')
+        else:
+            entries.append(f"<{email.upper()}>")
+    return ", ".join(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the To/Cc address helpers")
+    parser.add_argument("--addresses", type=int, default=2000, help="Addresses in each of To and Cc")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per implementation")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    to_header = build_header(args.addresses, rng) + ", Shape <shape@shapes.inc>"
+    cc_header = build_header(args.addresses, rng)
+    shape = "shape@shapes.inc"
+    sender = '"Sender, The" <sender@example.com>'
+
+    for label, function in (("legacy", legacy_extract_cc_list), ("current", extract_cc_list)):
+        seconds = timeit.timeit(lambda: function(to_header, cc_header, shape, sender), number=args.repeat)
+        result = function(to_header, cc_header, shape, sender)
+        print(f"{label:<8} {seconds / args.repeat * 1000:>9.2f} ms per call, {len(result)} cc entries")
+
+    legacy = legacy_extract_cc_list(to_header, cc_header, shape, sender)
+    current = extract_cc_list(to_header, cc_header, shape, sender)
+    broken = sum(1 for entry in legacy if entry.count("@") == 0)
+    print(f"\nLegacy output has {broken} entries without an address (quoted names split on commas)")
+    print(f"and {len(legacy) - len(set(e.lower() for e in legacy))} exact duplicates; current has none.")
@@ -24,7 +24,15 @@ SOFTWARE.
 
 import logging
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+
+def create_async_client() -> AsyncOpenAI:
+    """Create an async Shapes API client; share one across Brains to reuse its connections."""
+    return AsyncOpenAI(
+        api_key=os.getenv("SHAPES_API_KEY"),
+        base_url=os.getenv("SHAPES_API_URL"),
+    )
 
 
 class Brain:
@@ -38,34 +46,41 @@ class Brain:
     model for generating responses.
     """
 
-    def __init__(self, shape_username: str, user_id: str):
+    def __init__(self, shape_username: str, user_id: str, async_client: AsyncOpenAI = None):
         """
         Initialize the Brain with a specific shape.
 
         Args:
             shape_username (str): The username of the shape to use for generating replies.
                                  This corresponds to the model name in the Shapes API.
+            user_id (str): The user the replies are attributed to (sent as X-User-Id)
+            async_client (AsyncOpenAI, optional): Client used by agenerate_reply. Pass one
+                                                  shared client when creating many Brains.
         """
         self.shape_username = shape_username
         self.user_id = user_id
-        self.aclient = OpenAI(
-            api_key=os.getenv("SHAPES_API_KEY"),
-            base_url=os.getenv("SHAPES_API_URL"),
-        )
+        self._client = None
+        self.async_client = async_client
+
+    @property
+    def aclient(self) -> OpenAI:
+        """The synchronous Shapes API client, created on first use."""
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=os.getenv("SHAPES_API_KEY"),
+                base_url=os.getenv("SHAPES_API_URL"),
+            )
+        return self._client
 
-    def generate_reply(self, og_body: str) -> str:
+    def build_request(self, og_body: str) -> dict:
         """
-        Generate a reply to an email using the Shapes API.
-
-        This method takes the original email body and subject, and generates
-        a response using the specified shape's personality and style.
+        Build the chat completion arguments for a reply to an email.
 
         Args:
             og_body (str): The original email body text to respond to
-            subject (str, optional): The subject of the email. Defaults to empty string.
 
         Returns:
-            str: The generated reply text
+            dict: Keyword arguments for chat.completions.create
         """
         # Create the user message with instructions for the shape
         user_message = (
@@ -85,8 +100,7 @@ class Brain:
 
         user_message += f"\n\nHere is the email:\n{og_body}"
 
-        # Generate shape reply using the appropriate model
-        response = self.aclient.chat.completions.create(
+        return dict(
             model=f"shapesinc/{self.shape_username}",
             messages=[
                 {
@@ -101,11 +115,42 @@ class Brain:
                 # user-specific API key for each user.
             },
         )
+
+    def generate_reply(self, og_body: str) -> str:
+        """
+        Generate a reply to an email using the Shapes API.
+
+        This method takes the original email body and subject, and generates
+        a response using the specified shape's personality and style.
+
+        Args:
+            og_body (str): The original email body text to respond to
+
+        Returns:
+            str: The generated reply text
+        """
+        # Generate shape reply using the appropriate model
+        response = self.aclient.chat.completions.create(**self.build_request(og_body))
         email_reply = response.choices[0].message.content.strip()
 
         # return the reply
         return email_reply
 
+    async def agenerate_reply(self, og_body: str) -> str:
+        """
+        Generate a reply like generate_reply, without blocking the event loop.
+
+        Args:
+            og_body (str): The original email body text to respond to
+
+        Returns:
+            str: The generated reply text
+        """
+        if self.async_client is None:
+            self.async_client = create_async_client()
+        response = await self.async_client.chat.completions.create(**self.build_request(og_body))
+        return response.choices[0].message.content.strip()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,228 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from sentry_sdk import capture_exception
+
+
+class EmailQueue:
+    """
+    Durable work queue between the Mailgun webhook and email processing.
+
+    The webhook only writes the raw form payload to a spool directory and
+    returns, so Mailgun gets its answer in milliseconds. A pool of worker threads
+    then does the slow part (attachments, Shapes API, sending the reply).
+
+    Spool layout:
+        <spool>/<id>.json                     queued, not yet picked up
+        <spool>/processing/<owner>/<id>.json  claimed by a worker of process <owner>
+        <spool>/failed/<id>.json              every attempt raised, kept for inspection
+
+    Files are named after a hash of the Message-Id, so a redelivered webhook
+    for an email that is still queued or in progress is dropped (emails that
+    were already processed are caught by the MessageIndex). Queued files
+    survive restarts and are picked up again on start.
+
+    Each process claims emails into its own processing/<owner> directory and
+    holds an exclusive lock on a file in it for as long as it runs. On start,
+    owner directories whose lock can be taken belonged to a process that has
+    exited, so their emails are requeued, however recently they were claimed.
+    Several processes can share one spool.
+
+    An email whose processing raises is retried up to max_attempts times with
+    exponential backoff (the attempt count and next retry time are stored in
+    its spool file, so they survive restarts), then moved to failed/.
+    """
+
+    def __init__(self, process, spool_dir=None, workers=None, max_attempts=None, retry_backoff=None):
+        """
+        Initialize the EmailQueue.
+
+        Args:
+            process (callable): Called with the form dict of each email
+            spool_dir (str, optional): Spool directory. Defaults to EMAIL_SPOOL_DIR
+                                       or "shape-mail-spool" in the temp directory.
+            workers (int, optional): Number of worker threads. Defaults to EMAIL_WORKERS or 4.
+            max_attempts (int, optional): Processing attempts before an email is moved to
+                                          failed/. Defaults to EMAIL_MAX_ATTEMPTS or 5.
+            retry_backoff (float, optional): Seconds before the first retry, doubling after
+                                             each attempt. Defaults to EMAIL_RETRY_BACKOFF or 30.
+        """
+        self.process = process
+        self.spool_dir = spool_dir or os.getenv(
+            "EMAIL_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "shape-mail-spool")
+        )
+        self.workers = workers or int(os.getenv("EMAIL_WORKERS", 4))
+        self.max_attempts = max_attempts or int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("EMAIL_RETRY_BACKOFF", 30))
+
+        self.processing_root = os.path.join(self.spool_dir, "processing")
+        self.failed_dir = os.path.join(self.spool_dir, "failed")
+        for directory in (self.spool_dir, self.processing_root, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        self.processing_dir = None
+        self._lock_file = None
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def start(self):
+        """Take ownership of a processing directory, requeue orphaned and spooled emails, and start the workers."""
+        # Lock the directory under a hidden name first, so no other process sees it unlocked
+        setup_dir = tempfile.mkdtemp(dir=self.processing_root, prefix=".")
+        # Held until this process exits; the OS releases it even if the process is killed
+        self._lock_file = open(os.path.join(setup_dir, ".lock"), "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self.processing_dir = os.path.join(self.processing_root, uuid.uuid4().hex)
+        os.rename(setup_dir, self.processing_dir)
+
+        self._requeue_orphans()
+
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".json"):
+                self._queue.put(name)
+        logging.info(f"Email queue starting with {self._queue.qsize()} spooled emails")
+
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"email-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _requeue_orphans(self):
+        """Move emails claimed by processes that are no longer running back to the spool."""
+        for owner in os.listdir(self.processing_root):
+            owner_dir = os.path.join(self.processing_root, owner)
+            if owner.startswith(".") or owner_dir == self.processing_dir:
+                continue
+            try:
+                with open(os.path.join(owner_dir, ".lock"), "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    for name in os.listdir(owner_dir):
+                        if name.endswith(".json"):
+                            os.replace(os.path.join(owner_dir, name), os.path.join(self.spool_dir, name))
+            except BlockingIOError:
+                continue  # Another running process owns it
+            except FileNotFoundError:
+                continue  # Cleaned up by another process starting at the same time
+            shutil.rmtree(owner_dir, ignore_errors=True)
+
+    def _in_progress(self, name):
+        """Whether any process has this email claimed."""
+        return any(
+            os.path.exists(os.path.join(self.processing_root, owner, name))
+            for owner in os.listdir(self.processing_root)
+        )
+
+    def enqueue(self, form):
+        """
+        Spool an email for processing.
+
+        Args:
+            form (dict): The Mailgun webhook form fields
+
+        Returns:
+            bool: True if queued, False if this Message-Id is already queued or in progress
+        """
+        message_id = form.get("Message-Id", "")
+        name = hashlib.sha256(message_id.encode("utf-8")).hexdigest() + ".json"
+
+        path = os.path.join(self.spool_dir, name)
+        if os.path.exists(path) or self._in_progress(name):
+            return False
+
+        self._write(path, {"form": form, "attempts": 0, "retry_at": 0})
+        self._queue.put(name)
+        return True
+
+    def _write(self, path, entry):
+        """Write a spool entry atomically, so a crash never leaves a half-written email."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _requeue_later(self, name, delay):
+        """Put an email back on the in-memory queue after delay seconds."""
+        timer = threading.Timer(delay, self._queue.put, args=(name,))
+        timer.daemon = True
+        timer.start()
+
+    def _work(self):
+        """Worker loop: claim spooled emails one at a time and process them."""
+        while True:
+            name = self._queue.get()
+            try:
+                self._process_one(name)
+            finally:
+                self._queue.task_done()
+
+    def _process_one(self, name):
+        """Claim, process and remove one spooled email."""
+        processing_path = os.path.join(self.processing_dir, name)
+        try:
+            # Atomic claim: only one worker (or process sharing the spool) wins the rename
+            os.replace(os.path.join(self.spool_dir, name), processing_path)
+        except FileNotFoundError:
+            return
+
+        spool_path = os.path.join(self.spool_dir, name)
+        with open(processing_path, "r") as f:
+            entry = json.load(f)
+
+        # Picked up early (e.g. requeued on start): put it back until its retry time
+        wait = entry["retry_at"] - time.time()
+        if wait > 0:
+            os.replace(processing_path, spool_path)
+            self._requeue_later(name, wait)
+            return
+
+        try:
+            self.process(entry["form"])
+            os.remove(processing_path)
+        except Exception as e:
+            entry["attempts"] += 1
+            logging.error(
+                f"Error processing spooled email {name} (attempt {entry['attempts']} of {self.max_attempts}): {str(e)}"
+            )
+            capture_exception(e)
+            if entry["attempts"] >= self.max_attempts:
+                os.replace(processing_path, os.path.join(self.failed_dir, name))
+                return
+
+            delay = self.retry_backoff * 2 ** (entry["attempts"] - 1)
+            entry["retry_at"] = time.time() + delay
+            self._write(spool_path, entry)
+            os.remove(processing_path)
+            self._requeue_later(name, delay)
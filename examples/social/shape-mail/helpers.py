@@ -22,8 +22,103 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import re
 from datetime import datetime
 
+# One address: quoted strings, comments and angle addresses may contain the
+# "," and ";" separators, everything else runs up to the next separator
+_ADDRESS_CHUNK = re.compile(r'(?:"(?:[^"\\]+|\\.)*"?|\((?:[^()\\]+|\\.)*\)?|<[^>]*>?|[^,;"(<]+)+', re.S)
+
+# One alternative per RFC 5322 token kind; the matching group tells them apart
+_ADDRESS_TOKEN = re.compile(
+    r'"((?:[^"\\]|\\.)*)"?'  # 1: quoted string, e.g. "Doe, John"
+    r"|\(((?:[^()\\]|\\.)*)\)?"  # 2: comment, e.g. (John Doe)
+    r"|<([^>]*)>?"  # 3: angle address, e.g. <john@example.com>
+    r"|(:)"  # 4: end of a group name, e.g. "Team: a@example.com"
+    r'|([^":(<]+)',  # 5: anything else: words, whitespace, bare addresses
+    re.S,
+)
+_QUOTED_PAIR = re.compile(r"\\(.)", re.S)
+
+
+def parse_address_list(address_string):
+    """
+    Split an address header (To, Cc, From) into (name, email) pairs in one pass.
+
+    Commas inside quoted names ("Doe, John" <john@example.com>) or comments don't
+    split addresses. Handles "Name <email>", bare addresses, "email (Name)" and
+    group syntax ("Team: a@example.com, b@example.com;"). Nested comments are not
+    supported.
+
+    This is a little slower than the old split on "," (see benchmark_helpers.py),
+    which is deliberate: that split turned every quoted "Last, First" name into
+    two broken entries without an address, which ended up in the reply's Cc list.
+
+    Args:
+        address_string (str): The header value
+
+    Returns:
+        list: (name, email) tuples in order, skipping empty entries
+    """
+    addresses = []
+    for chunk in _ADDRESS_CHUNK.findall(address_string or ""):
+        if "(" in chunk or ":" in chunk or "\\" in chunk:
+            _parse_address_tokens(chunk, addresses)
+            continue
+
+        # Common case, "Name <email>" or a bare address: plain string operations suffice
+        name, bracket, rest = chunk.rpartition("<")
+        if not bracket:
+            email = chunk.strip()
+            if email:
+                addresses.append(("", email))
+            continue
+
+        email = rest.partition(">")[0].strip()
+        if '"' in name:
+            name = name.replace('"', "")
+        name = name.strip()
+        if "'" in name:
+            _append_address(addresses, name, email)
+        elif email:
+            addresses.append((name, email))
+    return addresses
+
+
+def _parse_address_tokens(chunk, addresses):
+    """Parse one address that has comments, escapes or a group name."""
+    phrase = []
+    address = None
+    comment = ""
+    for match in _ADDRESS_TOKEN.finditer(chunk):
+        kind = match.lastindex
+        value = match.group(kind)
+        if kind == 5:
+            if address is None:
+                phrase.append(value)
+        elif kind == 1:
+            phrase.append(_QUOTED_PAIR.sub(r"\1", value))
+        elif kind == 3:
+            address = value.strip()
+        elif kind == 2:
+            comment = comment or value
+        else:
+            phrase = []  # Group display name, not part of any address
+
+    if address is None:
+        # Bare address, with an optional "(Name)" comment
+        _append_address(addresses, comment.strip(), "".join(phrase).strip())
+    else:
+        _append_address(addresses, " ".join("".join(phrase).split()), address)
+
+
+def _append_address(addresses, name, email):
+    """Add a (name, email) pair, dropping empty entries and 'single quotes' around names."""
+    if len(name) > 1 and name[0] == name[-1] == "'":
+        name = name[1:-1]
+    if email:
+        addresses.append((name, email))
+
 
 def get_name_email_pairing(email_string):
     """
@@ -39,35 +134,18 @@ def get_name_email_pairing(email_string):
         
     Returns:
         list: List of dictionaries, each containing 'name' and 'email' keys
+              (a single empty pair if the string holds no address)
     """
-    # Split the string into a list of strings by comma
-    email_list = email_string.split(",")
-    return_list = []
-    for email_item in email_list:
-        # Strip leading and trailing spaces
-        email_item = email_item.strip()
-
-        # Check if there is a preceding text
-        if "<" in email_item and ">" in email_item:
-            # Split the string into a list of strings by '<'
-            email_parts = email_item.split("<")
-            # The last part is the email, remove the trailing '>'
-            email = email_parts[-1].replace(">", "")
-            # The preceding text is all parts except the last one, joined back together
-            preceding_text = "<".join(email_parts[:-1]).strip()
-        else:
-            # If there's no '<' and '>', the whole string is the email
-            email = email_item
-            preceding_text = ""
+    pairs = [{"name": name, "email": email} for name, email in parse_address_list(email_string)]
+    return pairs or [{"name": "", "email": ""}]
 
-        # Clean up the name
-        # Replace double quotes with an empty string
-        preceding_text = preceding_text.replace('"', "")
-        # Replace single quotes with an empty string
-        preceding_text = preceding_text.replace("'", "")
 
-        return_list.append({"name": preceding_text, "email": email})
-    return return_list
+def format_address(name, email):
+    """Format a (name, email) pair for a Cc/To header, quoting the name."""
+    if not name:
+        return email
+    escaped_name = name.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped_name}" <{email}>'
 
 
 def extract_cc_list(email1, email2, remove1, remove2):
@@ -75,7 +153,8 @@ def extract_cc_list(email1, email2, remove1, remove2):
     Process 'To' and 'Cc' lists to create a final CC list for the reply email.
     
     This function extracts email addresses from two input strings, removes specified
-    addresses, and formats them for inclusion in the CC field of an email.
+    addresses, and formats them for inclusion in the CC field of an email. Addresses
+    are compared case-insensitively and each one is listed once.
     
     Args:
         email1 (str): The first email string (typically the 'To' field)
@@ -86,33 +165,17 @@ def extract_cc_list(email1, email2, remove1, remove2):
     Returns:
         list: Formatted list of email addresses for the CC field
     """
-    email1_list = get_name_email_pairing(email1)
-    email2_list = get_name_email_pairing(email2)
-    remove1_list = get_name_email_pairing(remove1)
-    remove2_list = get_name_email_pairing(remove2)
+    # Seeded with the removed addresses, so they are skipped just like duplicates
+    seen = {email.lower() for _, email in parse_address_list(remove1)}
+    seen.update(email.lower() for _, email in parse_address_list(remove2))
 
-    black_list = [remove1_list[0]["email"], remove2_list[0]["email"]]
     cc_list = []
-
-    # Process email1 list (To field)
-    for item in email1_list:
-        email = item["email"]
-        name = item["name"]
-        if email not in black_list:
-            if name:
-                cc_list.append(f'"{name}" <{email}>')
-            else:
-                cc_list.append(email)
-
-    # Process email2 list (Cc field)
-    for item in email2_list:
-        email = item["email"]
-        name = item["name"]
-        if email not in black_list:
-            if name:
-                cc_list.append(f'"{name}" <{email}>')
-            else:
-                cc_list.append(email)
+    for address_string in (email1, email2):
+        for name, email in parse_address_list(address_string):
+            key = email.lower()
+            if key not in seen:
+                seen.add(key)
+                cc_list.append(format_address(name, email) if name else email)
 
     return cc_list
 
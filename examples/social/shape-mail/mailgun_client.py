@@ -0,0 +1,215 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from sentry_sdk import capture_exception
+from urllib3.exceptions import NewConnectionError
+
+from helpers import format_address
+
+# Mailgun accepts at most this many recipients per batch message
+MAX_BATCH_RECIPIENTS = 1000
+
+
+class MailgunSendUncertain(Exception):
+    """
+    The send failed in a way that doesn't tell whether Mailgun accepted the
+    message (a read timeout, a dropped connection or a 5xx). Sending again
+    could deliver it twice, so callers shouldn't retry.
+    """
+
+
+class MailgunBatchFailed(Exception):
+    """
+    A batch of send_batch failed after earlier batches were sent.
+
+    Attributes:
+        sent_count (int): Recipients covered by the batches that were sent; resume
+                          with recipients[sent_count:]
+        responses (list): The Mailgun responses of those batches
+        uncertain (bool): Whether the failed batch itself may have been accepted
+                          (MailgunSendUncertain), so resuming could send it twice
+    """
+
+    def __init__(self, sent_count, responses, error):
+        super().__init__(f"mailgun batch failed after {sent_count} recipients: {str(error)}")
+        self.sent_count = sent_count
+        self.responses = responses
+        self.uncertain = isinstance(error, MailgunSendUncertain)
+
+
+def _failed_before_sending(error):
+    """Whether a requests error means the request never reached Mailgun, so resending is safe."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class MailgunClient:
+    """
+    Client for the Mailgun messages API.
+
+    Keeps one pooled session (so sends reuse TLS connections), retries rate
+    limits and connection failures with exponential backoff, and supports batch
+    sending: one API call delivers a separate copy of a message to each of up
+    to 1000 recipients, personalised through recipient variables.
+
+    The messages API isn't idempotent, so only failures where Mailgun can't have
+    accepted the message are retried: connection errors before the request was
+    sent, and 429 responses. Read timeouts and 5xx responses raise
+    MailgunSendUncertain instead of resending.
+    """
+
+    def __init__(self, api_url=None, api_key=None, max_retries=None, backoff=None, pool_size=None):
+        """
+        Initialize the MailgunClient.
+
+        Args:
+            api_url (str, optional): The messages endpoint. Defaults to MAILGUN_API_URL.
+            api_key (str, optional): The Mailgun API key. Defaults to MAILGUN_API_KEY.
+            max_retries (int, optional): Retries after a 429 or a failed connection.
+                                         Defaults to MAILGUN_MAX_RETRIES or 4.
+            backoff (float, optional): First retry delay in seconds, doubled each retry.
+                                       Defaults to MAILGUN_BACKOFF or 1.
+            pool_size (int, optional): Connections kept open. Defaults to MAILGUN_POOL_SIZE or 10.
+        """
+        self.api_url = api_url or os.getenv("MAILGUN_API_URL")
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("MAILGUN_MAX_RETRIES", 4))
+        self.backoff = backoff or float(os.getenv("MAILGUN_BACKOFF", 1))
+        pool_size = pool_size or int(os.getenv("MAILGUN_POOL_SIZE", 10))
+
+        self.session = requests.Session()
+        self.session.auth = ("api", api_key or os.getenv("MAILGUN_API_KEY"))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, data):
+        """
+        Send one message.
+
+        Args:
+            data (dict): The form fields of the Mailgun messages API (from, to, subject, text, h:...)
+
+        Returns:
+            Response: The response from the Mailgun API
+
+        Raises:
+            MailgunSendUncertain: If Mailgun may or may not have accepted the message
+            Exception: If the Mailgun API call fails after all retries
+        """
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                resp = self.session.post(self.api_url, data=data, timeout=30)
+            except requests.RequestException as e:
+                if not _failed_before_sending(e):
+                    capture_exception(e)
+                    raise MailgunSendUncertain(f"mailgun failed: {str(e)}") from e
+                if last_attempt:
+                    capture_exception(e)
+                    raise Exception("mailgun failed") from e
+                logging.warning(f"Mailgun request failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+                continue
+
+            logging.info(resp.status_code)
+            logging.info(resp.headers)
+            if resp.status_code == 200:
+                return resp
+
+            if resp.status_code >= 500:
+                error = MailgunSendUncertain(f"mailgun failed: {resp.status_code}")
+                capture_exception(error)
+                raise error
+            if last_attempt or resp.status_code != 429:
+                capture_exception(Exception("mailgun failed"))
+                raise Exception("mailgun failed")
+
+            # Honour Retry-After on rate limits when Mailgun sends one
+            wait = delay
+            retry_after = resp.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                wait = max(wait, int(retry_after))
+            logging.warning(f"Mailgun returned {resp.status_code}, retrying in {wait:.1f}s")
+            time.sleep(wait)
+            delay *= 2
+
+    def send_batch(self, data, recipients):
+        """
+        Send a message to many recipients, one copy each, in as few API calls as possible.
+
+        Recipients don't see each other. The subject and text can reference each
+        recipient's variables as %recipient.<name>%, e.g. "Hi %recipient.name%".
+
+        Args:
+            data (dict): The shared form fields (from, subject, text, h:...), without "to"
+            recipients (list): Dicts with an "email" key plus any other variables
+
+        Returns:
+            list: The Mailgun responses, one per batch of up to 1000 recipients
+
+        Raises:
+            MailgunBatchFailed: If a batch fails; it records how far the send got
+        """
+        responses = []
+        for start in range(0, len(recipients), MAX_BATCH_RECIPIENTS):
+            batch = recipients[start:start + MAX_BATCH_RECIPIENTS]
+            variables = {recipient["email"]: recipient for recipient in batch}
+            batch_data = dict(data)
+            # Quoted, so a comma or "<" in a name can't split or redirect the address list
+            batch_data["to"] = [format_address(recipient.get("name"), recipient["email"]) for recipient in batch]
+            batch_data["recipient-variables"] = json.dumps(variables)
+            try:
+                responses.append(self.send(batch_data))
+            except Exception as e:
+                raise MailgunBatchFailed(start, responses, e) from e
+        return responses
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mailgun_client():
+    """
+    Get the process-wide MailgunClient, creating it on first use.
+
+    Created lazily so the environment (.env) is loaded before it reads its settings.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MailgunClient()
+        return _client
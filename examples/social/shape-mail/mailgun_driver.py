@@ -22,20 +22,69 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import hashlib
+import hmac
 import json
 import logging
 import os
-import io
 import uuid
 import time
 from datetime import datetime
 
 from helpers import extract_cc_list, format_reply_body, get_name_email_pairing
-import requests
+from attachments import get_attachment_extractor
 from brain import Brain
-from sentry_sdk import capture_exception
+from mailgun_client import MailgunSendUncertain, get_mailgun_client
+from message_index import get_message_index
+from prompt_budget import get_prompt_budget
+from sender_filter import get_sender_filter
 from models import QualifiedEmail
-import PyPDF2
+
+
+def intro_email_context(recipient_name):
+    """
+    Build the minimal context given to a shape writing a first email to someone.
+
+    Args:
+        recipient_name (str): The name of the recipient
+
+    Returns:
+        str: The context to pass to Brain.generate_reply as og_body
+    """
+    return (
+        f"[There is no email from the user. You are sending an email to {recipient_name}."
+        f" Write a friendly introduction email to the user. Make sure to make it"
+        f" interesting and engaging for them to reply back. Write it in email format.]\n\n"
+    )
+
+
+def shape_email_data(shape_username, domain, recipient_email, cc_list, subject, body):
+    """
+    Build the Mailgun form fields for a new (non-reply) email from a shape.
+
+    Args:
+        shape_username (str): The username of the shape sending the email
+        domain (str): Email domain of the shape
+        recipient_email (str): The email address of the recipient
+        cc_list (list): List of email addresses to CC
+        subject (str): The subject of the email
+        body (str): The body of the email
+
+    Returns:
+        dict: Form fields for MailgunClient.send
+    """
+    # Generate a unique Message-ID for this new email
+    unique_id = str(uuid.uuid4())
+    new_message_id = f"<{unique_id}@{domain}>"
+
+    return {
+        "from": "{} <{}@{}>".format(shape_username, shape_username, domain),
+        "to": [recipient_email],
+        "cc": cc_list,
+        "subject": subject,
+        "text": body,
+        "h:Message-ID": new_message_id,
+    }
 
 
 class MailgunDriver:
@@ -51,124 +100,91 @@ class MailgunDriver:
         """Initialize the MailgunDriver."""
         pass
 
-    def generate_qualified_email(self, request):
+    def validate_webhook(self, form):
+        """
+        Check that a webhook payload is a usable email from Mailgun.
+
+        If MAILGUN_WEBHOOK_SIGNING_KEY is set, the timestamp/token/signature fields
+        are verified against it as described in the Mailgun webhook docs.
+
+        Args:
+            form (dict): The form fields posted by Mailgun
+
+        Returns:
+            str or None: A description of the problem, or None if the payload is valid
+        """
+        for field in ("from", "recipient", "Message-Id"):
+            if not form.get(field):
+                return f"missing {field}"
+        if "@" not in form["recipient"]:
+            return "invalid recipient"
+
+        signing_key = os.getenv("MAILGUN_WEBHOOK_SIGNING_KEY")
+        if signing_key:
+            timestamp = form.get("timestamp", "")
+            token = form.get("token", "")
+            expected = hmac.new(
+                signing_key.encode("utf-8"),
+                f"{timestamp}{token}".encode("utf-8"),
+                hashlib.sha256,
+            ).hexdigest()
+            if not hmac.compare_digest(expected, form.get("signature", "")):
+                return "invalid signature"
+
+        return None
+
+    def generate_qualified_email(self, form):
         """
-        Process incoming request data into a structured email object.
+        Process incoming form data into a structured email object.
 
-        This method extracts all relevant information from the Mailgun webhook request
+        This method extracts all relevant information from the Mailgun webhook form
         and creates a QualifiedEmail object that contains all necessary data for
         generating and sending a reply.
 
         Args:
-            request: The Flask request object containing form data from Mailgun
+            form (dict): The form fields posted by Mailgun (request.form or a spooled copy)
 
         Returns:
             QualifiedEmail: A structured object containing all email information
         """
         # The person who sent the email, will now be the recipient receiving our outbound email
-        outbound_recipient = request.form.get("from").replace('"', "")
+        outbound_recipient = form.get("from")
         name_email_pair = get_name_email_pairing(outbound_recipient)[0]
         outbound_email_name = name_email_pair["name"]
         outbound_email_address = name_email_pair["email"]
 
         # Email id to uniquely identify the email
-        message_id = request.form.get("Message-Id")
+        message_id = form.get("Message-Id")
 
         # This is the person who received the email
         # i.e. the shape
-        recipient = request.form.get("recipient")
+        recipient = form.get("recipient")
         shape_username = recipient.split("@")[0]
         domain = recipient.split("@")[1]
 
         # Subject of the email
-        subject = request.form.get("subject", "")
+        subject = form.get("subject", "")
         # Body of the email
-        body = request.form.get("body-plain", "")
+        body = form.get("body-plain", "")
 
         # Handle attachments (excluding images)
-        attachment_content = ""
-        attachments_json = request.form.get("attachments")
+        attachments_json = form.get("attachments")
         if attachments_json:
             try:
-                import json
-
                 attachments = json.loads(attachments_json)
-                for attachment in attachments:
-                    attachment_name = attachment.get("name", "")
-                    content_type = attachment.get("content-type", "")
-                    attachment_url = attachment.get("url", "")
-
-                    # Skip image attachments
-                    if content_type.startswith("image/"):
-                        continue
-
-                    # Process text-based attachments
-                    if attachment_name and content_type.startswith(
-                        (
-                            "text/",
-                            "application/pdf",
-                            "application/msword",
-                            "application/vnd.openxmlformats-officedocument",
-                        )
-                    ):
-                        try:
-                            # Download the attachment content from Mailgun's storage
-                            auth = ("api", os.getenv("MAILGUN_API_KEY"))
-                            attachment_response = requests.get(
-                                attachment_url, auth=auth
-                            )
-
-                            if attachment_response.status_code == 200:
-                                # For PDF and binary files, we might need special handling
-                                if content_type == "application/pdf":
-                                    # Extract text from PDF if PyPDF2 is available
-                                    try:
-                                        # Create a file-like object from the binary content
-                                        pdf_content = io.BytesIO(
-                                            attachment_response.content
-                                        )
-                                        # Create a PDF reader object
-                                        pdf_reader = PyPDF2.PdfReader(pdf_content)
-                                        # Extract text from each page
-                                        pdf_text = ""
-                                        for page_num in range(len(pdf_reader.pages)):
-                                            page = pdf_reader.pages[page_num]
-                                            pdf_text += page.extract_text() + "\n\n"
-                                        # Add the extracted text to the attachment content
-                                        if pdf_text.strip():
-                                            attachment_content += f"\n\n--- ATTACHMENT: {attachment_name} ---\n{pdf_text}\n--- END ATTACHMENT ---\n\n"
-                                        else:
-                                            attachment_content += f"\n\n--- ATTACHMENT: {attachment_name} ---\n[PDF contains no extractable text or contains only images]\n--- END ATTACHMENT ---\n\n"
-                                    except Exception as e:
-                                        logging.error(
-                                            f"Error extracting text from PDF {attachment_name}: {str(e)}"
-                                        )
-                                        attachment_content += f"\n\n--- ATTACHMENT: {attachment_name} ---\n[Error extracting PDF text: {str(e)}]\n--- END ATTACHMENT ---\n\n"
-                                else:
-                                    # For text-based files, attempt to decode the content
-                                    try:
-                                        attachment_text = (
-                                            attachment_response.content.decode(
-                                                "utf-8", errors="ignore"
-                                            )
-                                        )
-                                        attachment_content += f"\n\n--- ATTACHMENT: {attachment_name} ---\n{attachment_text}\n--- END ATTACHMENT ---\n\n"
-                                    except Exception as e:
-                                        attachment_content += f"\n\n--- ATTACHMENT: {attachment_name} ---\n[Content could not be decoded: {str(e)}]\n--- END ATTACHMENT ---\n\n"
-                        except Exception as e:
-                            logging.error(
-                                f"Error downloading attachment {attachment_name}: {str(e)}"
-                            )
+                # Downloads run concurrently, PDF/Office parsing on a process pool
+                attachment_content = get_attachment_extractor().extract(attachments)
             except Exception as e:
                 logging.error(f"Error processing attachments JSON: {str(e)}")
+                attachment_content = ""
 
             # Append attachment content to body if available
             if attachment_content:
                 body += attachment_content
 
         # Process and re-order the extra recipients in the cc and to fields
-        to_list = request.form.get("To", "")
-        cc_list = request.form.get("Cc", "")
+        to_list = form.get("To", "")
+        cc_list = form.get("Cc", "")
         # Combine all, put in cc, except email that's mine or sender's
         final_cc_list = extract_cc_list(
             to_list,  # to email list,
@@ -180,8 +196,8 @@ class MailgunDriver:
         final_cc_list = [item for item in final_cc_list if item]
 
         # Get email threading headers
-        in_reply_to = request.form.get("In-Reply-To", "")
-        references = request.form.get("References", "")
+        in_reply_to = form.get("In-Reply-To", "")
+        references = form.get("References", "")
 
         # Initialize the qualified email object with all required fields
         qualified_email = QualifiedEmail(
@@ -203,48 +219,76 @@ class MailgunDriver:
 
     def process_message(self, request):
         """
-        Process an incoming email request and generate a reply.
+        Process an incoming email request and generate a reply, synchronously.
+
+        Args:
+            request: The Flask request object containing form data from Mailgun
+
+        Returns:
+            str: "OK" if the processing was successful
+        """
+        return self.process_form(request.form)
+
+    def process_form(self, form):
+        """
+        Process an incoming email and generate a reply.
 
         This method:
-        1. Extracts the email details from the request
+        1. Extracts the email details from the form
         2. Determines which shape to use for the reply
         3. Generates a reply using the Shapes API
         4. Sends the reply back to the original sender
 
         Args:
-            request: The Flask request object containing form data from Mailgun
+            form (dict): The form fields posted by Mailgun (request.form or a spooled copy)
 
         Returns:
             str: "OK" if the processing was successful
         """
+        # Skip redeliveries before downloading attachments or calling the Shapes API
+        message_id = form.get("Message-Id")
+        message_index = get_message_index()
+        if message_id and not message_index.claim(message_id):
+            logging.info(f"Skipping already processed email {message_id}")
+            return "OK"
+
+        try:
+            return self._reply(form)
+        except MailgunSendUncertain:
+            # The reply may have gone out: keep the claim so a retry doesn't send it twice
+            raise
+        except Exception:
+            # Nothing was sent (send_message is the last step), so allow a retry
+            if message_id:
+                message_index.release(message_id)
+            raise
+
+    def _reply(self, form):
+        """Generate and send the reply for an email that has been claimed."""
         # Process incoming message into a qualified email Pydantic object
-        qualified_email = self.generate_qualified_email(request)
+        qualified_email = self.generate_qualified_email(form)
 
         # FT: Ignore emails from specific senders
-        # Get ignore and allow lists from environment variables
-        ignore_list = os.getenv("IGNORE_LIST").split(",")
-        allow_list = os.getenv("ALLOW_LIST").split(",")
-
-        # Check if sender should be ignored (matches ignore_list but not in allow_list)
-        def should_ignore_email(email):
-            # If email exactly matches an allowed email, don't ignore it
-            if email in allow_list:
-                return False
-            # Otherwise, ignore if it ends with any pattern in ignore_list
-            return any(email.endswith(pattern) for pattern in ignore_list)
+        # Matches ignore_list suffixes unless the address is in allow_list (see SenderFilter)
+        sender_filter = get_sender_filter()
 
         # Check if outbound email should be ignored
-        if should_ignore_email(qualified_email.outbound_email_address):
+        if sender_filter.should_ignore(qualified_email.outbound_email_address):
             return "OK"
 
-        # Filter cc_list to remove ignored emails
+        # Filter cc_list to remove ignored emails (entries may be '"Name" <email>')
         if qualified_email.cc_list:
             qualified_email.cc_list = [
-                cc for cc in qualified_email.cc_list if not should_ignore_email(cc)
+                cc
+                for cc in qualified_email.cc_list
+                if not sender_filter.should_ignore(get_name_email_pairing(cc)[0]["email"])
             ]
 
         # Generate the reply body using the shapes API
 
+        # Drop quoted history and repeated signatures, and fit attachments to the token
+        # budget; only the body is reduced, the headers above it are always kept whole
+        budgeted_body = get_prompt_budget().apply(qualified_email.body)
         body = (
             f"From:\n{qualified_email.outbound_email_name}"
             f"<{qualified_email.outbound_email_address}>"
@@ -252,7 +296,7 @@ class MailgunDriver:
             f"\nSubject:"
             f"\n{qualified_email.subject}"
             f"\nBody:"
-            f"\n{qualified_email.body}"
+            f"\n{budgeted_body}"
         )
         reply_body = Brain(
             shape_username=qualified_email.shape_username,
@@ -334,10 +378,8 @@ class MailgunDriver:
                 updated_references = message_id
 
         # Send the email via Mailgun API
-        resp = requests.post(
-            os.getenv("MAILGUN_API_URL"),
-            auth=("api", os.getenv("MAILGUN_API_KEY")),
-            data={
+        return get_mailgun_client().send(
+            {
                 "from": "{} <{}>".format(from_name, from_email),
                 "to": [to_email],
                 "cc": cc_list,
@@ -346,18 +388,9 @@ class MailgunDriver:
                 "h:In-Reply-To": message_id,  # Use original message_id as In-Reply-To
                 "h:References": updated_references,
                 "h:Message-ID": new_message_id,  # Use new unique Message-ID
-            },
+            }
         )
 
-        # Log the response and handle errors
-        logging.info(resp.status_code)
-        logging.info(resp.headers)
-        if resp.status_code != 200:
-            capture_exception(Exception("mailgun failed"))
-            raise Exception("mailgun failed")
-
-        return resp
-
     def send_shape_email(
         self,
         shape_username,
@@ -403,49 +436,65 @@ class MailgunDriver:
 
         # Generate email body if requested
         if generate_body:
-            # Create a minimal context for the shape
-            context = (
-                f"[There is no email from the user. You are sending an email to {recipient_name}."
-                f" Write a friendly introduction email to the user. Make sure to make it"
-                f" interesting and engaging for them to reply back. Write it in email format.]\n\n"
-            )
             # Generate body using the shape's brain
             generated_body = Brain(
                 shape_username=shape_username,
                 user_id=recipient_email,
-            ).generate_reply(og_body=context)
+            ).generate_reply(og_body=intro_email_context(recipient_name))
 
             email_body = generated_body
         else:
             email_body = body
 
-        # Generate a unique Message-ID for this new email
-        unique_id = str(uuid.uuid4())
-        new_message_id = f"<{unique_id}@{domain}>"
-
         # Send the email via Mailgun API
-        resp = requests.post(
-            os.getenv("MAILGUN_API_URL"),
-            auth=("api", os.getenv("MAILGUN_API_KEY")),
-            data={
+        return get_mailgun_client().send(
+            shape_email_data(shape_username, domain, recipient_email, cc_list, subject, email_body)
+        )
+
+    def send_shape_campaign(
+        self,
+        shape_username,
+        recipients,
+        subject="",
+        body="",
+        domain=None,
+    ):
+        """
+        Send the same email from a shape to many recipients using Mailgun batch sending.
+
+        Every recipient gets their own copy (nobody sees the other addresses), and
+        thousands of recipients only take a handful of API calls. The subject and
+        body can be personalised with %recipient.<variable>% placeholders, e.g.
+        "Hi %recipient.name%", filled in from each recipient's dict.
+
+        Args:
+            shape_username (str): The username of the shape sending the email
+            recipients (list): Dicts with an "email" key and optionally "name" or other variables
+            subject (str, optional): The subject of the email. Defaults to empty string.
+            body (str, optional): The body of the email. Defaults to empty string.
+            domain (str, optional): Email domain to use. Defaults to domain from environment variable.
+
+        Returns:
+            list: The responses from the Mailgun API, one per batch of up to 1000 recipients
+
+        Raises:
+            MailgunBatchFailed: If a batch fails; its sent_count and uncertain attributes tell
+                                which recipients already got the email
+        """
+        # Use default domain if not provided
+        if domain is None:
+            domain = os.getenv("EMAIL_DOMAIN")
+
+        # Message-IDs are left to Mailgun, which gives each copy its own
+        return get_mailgun_client().send_batch(
+            {
                 "from": "{} <{}@{}>".format(shape_username, shape_username, domain),
-                "to": [recipient_email],
-                "cc": cc_list,
                 "subject": subject,
-                "text": email_body,
-                "h:Message-ID": new_message_id,
+                "text": body,
             },
+            recipients,
         )
 
-        # Log the response and handle errors
-        logging.info(resp.status_code)
-        logging.info(resp.headers)
-        if resp.status_code != 200:
-            capture_exception(Exception("mailgun failed"))
-            raise Exception("mailgun failed")
-
-        return resp
-
 
 if __name__ == "__main__":
     # Load environment variables from .env file
@@ -28,6 +28,8 @@ from flask import Flask, request
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
 from mailgun_driver import MailgunDriver
+from email_queue import EmailQueue
+from message_index import get_message_index
 from dotenv import load_dotenv
 
 # Set up logging
@@ -53,6 +55,13 @@ if os.environ.get("SENTRY_DSN"):
     )
 app = Flask(__name__)
 
+# Emails are processed by background workers; the webhook only spools them
+email_queue = EmailQueue(process=MailgunDriver().process_form)
+# Attachment parsing processes re-import this module as __mp_main__ when it was run
+# with "python main.py"; only the real server process runs the queue
+if __name__ != "__mp_main__":
+    email_queue.start()
+
 
 @app.route("/hello/", methods=["GET", "POST"])
 def welcome():
@@ -70,12 +79,24 @@ def mailgun():
     Webhook endpoint that receives POSTs from Mailgun when new emails arrive.
     The path is configurable via the MAILGUN_WEBHOOK_PATH environment variable.
     
-    Processes the incoming email and generates a reply using the appropriate shape.
+    Validates the payload and queues it; a background worker then generates and
+    sends the reply using the appropriate shape. Answering quickly keeps Mailgun
+    from timing out and retrying, which used to produce duplicate replies.
     
     Returns:
-        str: "OK" if the email was processed successfully
+        str: "OK" if the email was queued (or is a duplicate), or an error with status 406
+             so Mailgun doesn't retry a payload that will never be valid
     """
-    return MailgunDriver().process_message(request)
+    form = request.form.to_dict()
+    error = MailgunDriver().validate_webhook(form)
+    if error:
+        logging.warning(f"Rejected Mailgun webhook: {error}")
+        return error, 406
+
+    # Cheap check first: a redelivery of an already answered email isn't spooled at all
+    if get_message_index().seen(form["Message-Id"]) or not email_queue.enqueue(form):
+        logging.info(f"Ignoring duplicate delivery of {form['Message-Id']}")
+    return "OK"
 
 
 if __name__ == "__main__":
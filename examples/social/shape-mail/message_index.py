@@ -0,0 +1,200 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DUPLICATE_MEMORY_SECONDS = 60
+
+
+class MessageIndex:
+    """
+    Time-bounded record of the Message-Ids that have already been handled.
+
+    Mailgun redelivers webhooks, sometimes many times over, and every delivery
+    that gets through means another Shapes completion and another outbound email.
+    Each Message-Id is claimed once; later claims within the TTL fail.
+
+    Recent ids are kept in an in-memory LRU so retry storms are answered without
+    I/O. The durable store is a SQLite file (shared by every process on the host)
+    or, when MESSAGE_INDEX_REDIS_URL is set, Redis (shared across hosts).
+    """
+
+    def __init__(self, ttl=None, path=None, redis_url=None, cache_size=None):
+        """
+        Initialize the MessageIndex.
+
+        Args:
+            ttl (int, optional): Seconds a Message-Id stays claimed. Defaults to
+                                 MESSAGE_INDEX_TTL or 3 days, well past Mailgun's retry window.
+            path (str, optional): SQLite database file. Defaults to MESSAGE_INDEX_PATH
+                                  or "shape-mail-messages.sqlite3" in the temp directory.
+            redis_url (str, optional): Use Redis instead of SQLite. Defaults to MESSAGE_INDEX_REDIS_URL.
+            cache_size (int, optional): Entries kept in memory. Defaults to MESSAGE_INDEX_CACHE_SIZE or 10000.
+        """
+        self.ttl = ttl or int(os.getenv("MESSAGE_INDEX_TTL", 3 * 24 * 60 * 60))
+        self.cache_size = cache_size or int(os.getenv("MESSAGE_INDEX_CACHE_SIZE", 10000))
+        redis_url = redis_url or os.getenv("MESSAGE_INDEX_REDIS_URL")
+
+        # Message-Id -> time the memory entry expires, least recently used first
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._claims = 0
+
+        self._redis = None
+        self._db = None
+        if redis_url:
+            import redis  # Only needed when Redis is configured
+
+            self._redis = redis.Redis.from_url(redis_url)
+        else:
+            path = path or os.getenv(
+                "MESSAGE_INDEX_PATH", os.path.join(tempfile.gettempdir(), "shape-mail-messages.sqlite3")
+            )
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages (message_id TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+            )
+            self._prune()
+
+    def seen(self, message_id):
+        """
+        Check whether a Message-Id has been claimed within the TTL, without claiming it.
+
+        Args:
+            message_id (str): The Message-Id header value
+
+        Returns:
+            bool: True if the email was already handled (or is being handled)
+        """
+        if self._seen_recently(message_id):
+            return True
+
+        if self._redis is not None:
+            return bool(self._redis.exists(self._redis_key(message_id)))
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM messages WHERE message_id = ? AND claimed_at > ?",
+                (message_id, time.time() - self.ttl),
+            ).fetchone()
+        return row is not None
+
+    def claim(self, message_id):
+        """
+        Atomically claim a Message-Id.
+
+        Args:
+            message_id (str): The Message-Id header value
+
+        Returns:
+            bool: True if this caller should handle the email, False if it's a duplicate
+        """
+        if self._seen_recently(message_id):
+            return False
+
+        now = time.time()
+        if self._redis is not None:
+            claimed = bool(self._redis.set(self._redis_key(message_id), int(now), nx=True, ex=self.ttl))
+        else:
+            with self._lock:
+                # Insert, or take over an expired claim; rowcount is 0 if a live claim exists
+                cursor = self._db.execute(
+                    "INSERT INTO messages (message_id, claimed_at) VALUES (?, ?) "
+                    "ON CONFLICT(message_id) DO UPDATE SET claimed_at = excluded.claimed_at "
+                    "WHERE claimed_at <= ?",
+                    (message_id, now, now - self.ttl),
+                )
+                claimed = cursor.rowcount == 1
+                self._claims += 1
+            if self._claims % 1000 == 0:
+                self._prune()
+
+        # A claim owned elsewhere may still be released after a failure, so duplicates
+        # are only trusted from memory for a short while
+        self._remember(message_id, now + (self.ttl if claimed else min(self.ttl, DUPLICATE_MEMORY_SECONDS)))
+        return claimed
+
+    def release(self, message_id):
+        """
+        Drop a claim so a later delivery is processed again, e.g. after a failure before sending.
+
+        Args:
+            message_id (str): The Message-Id header value
+        """
+        with self._lock:
+            self._recent.pop(message_id, None)
+            if self._redis is None:
+                self._db.execute("DELETE FROM messages WHERE message_id = ?", (message_id,))
+        if self._redis is not None:
+            self._redis.delete(self._redis_key(message_id))
+
+    def _redis_key(self, message_id):
+        return f"shape-mail:message:{message_id}"
+
+    def _seen_recently(self, message_id):
+        with self._lock:
+            expires_at = self._recent.get(message_id)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._recent[message_id]
+                return False
+            self._recent.move_to_end(message_id)
+            return True
+
+    def _remember(self, message_id, expires_at):
+        with self._lock:
+            self._recent[message_id] = expires_at
+            self._recent.move_to_end(message_id)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+    def _prune(self):
+        """Delete expired rows so the database stays bounded."""
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM messages WHERE claimed_at <= ?", (time.time() - self.ttl,)
+            ).rowcount
+        if deleted:
+            logging.info(f"Pruned {deleted} expired Message-Ids from the message index")
+
+
+_message_index = None
+_message_index_lock = threading.Lock()
+
+
+def get_message_index():
+    """Return the process-wide MessageIndex, creating it on first use."""
+    global _message_index
+    with _message_index_lock:
+        if _message_index is None:
+            _message_index = MessageIndex()
+        return _message_index
@@ -0,0 +1,259 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from brain import Brain, create_async_client
+from mailgun_client import MailgunSendUncertain, get_mailgun_client
+from mailgun_driver import intro_email_context, shape_email_data
+
+
+def read_recipients(path):
+    """
+    Stream recipients from a CSV file with an "email" column and an optional "name" column.
+
+    Args:
+        path (str): Path to the CSV file
+
+    Yields:
+        dict: {"email": ..., "name": ...} for each row with an email address
+    """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            email = (row.get("email") or "").strip()
+            if email:
+                yield {"email": email, "name": (row.get("name") or "").strip()}
+
+
+class RateLimiter:
+    """Spaces out calls so no more than rate_per_minute start in any minute."""
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Wait for the next free slot."""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Outreach:
+    """
+    Generates and sends a personalised introduction email from a shape to many recipients.
+
+    A bounded pool of async workers generates bodies concurrently, paced to the
+    Shapes API rate limit, and each email is handed to Mailgun as soon as its body
+    is ready rather than after the whole list. Progress is appended to a JSONL
+    checkpoint file: generated bodies are recorded before sending, so an
+    interrupted run resumes without regenerating anything and never re-sends an
+    email that went out. Emails Mailgun may or may not have accepted (a timeout
+    or server error after sending) are recorded as "uncertain"; later runs skip
+    them and list them for manual review.
+    """
+
+    def __init__(
+        self,
+        shape_username,
+        subject,
+        checkpoint_path,
+        domain=None,
+        concurrency=None,
+        rate_per_minute=None,
+    ):
+        """
+        Initialize the Outreach run.
+
+        Args:
+            shape_username (str): The username of the shape sending the emails
+            subject (str): The subject of the emails
+            checkpoint_path (str): JSONL file recording progress; reuse it to resume a run
+            domain (str, optional): Email domain to use. Defaults to EMAIL_DOMAIN.
+            concurrency (int, optional): Bodies generated at once. Defaults to OUTREACH_CONCURRENCY or 4.
+            rate_per_minute (int, optional): Shapes API calls per minute. Defaults to
+                                             OUTREACH_RATE_PER_MINUTE or 20.
+        """
+        self.shape_username = shape_username
+        self.subject = subject
+        self.checkpoint_path = checkpoint_path
+        self.domain = domain or os.getenv("EMAIL_DOMAIN")
+        self.concurrency = concurrency or int(os.getenv("OUTREACH_CONCURRENCY", 4))
+        self.rate_limiter = RateLimiter(rate_per_minute or int(os.getenv("OUTREACH_RATE_PER_MINUTE", 20)))
+
+        self.sent = set()
+        self.uncertain = set()
+        self.generated = {}
+        self.counts = {"sent": 0, "skipped": 0, "failed": 0, "uncertain": 0, "resumed": 0}
+        self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        """Read what a previous run already generated and sent."""
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line from an interrupted run
+                email = record["email"].lower()
+                if record["status"] == "sent":
+                    self.sent.add(email)
+                    self.uncertain.discard(email)
+                    self.generated.pop(email, None)
+                elif record["status"] == "uncertain" and email not in self.sent:
+                    self.uncertain.add(email)
+                    self.generated.pop(email, None)
+                elif record["status"] == "generated" and email not in self.sent and email not in self.uncertain:
+                    self.generated[email] = record["body"]
+        logging.info(
+            f"Resuming outreach: {len(self.sent)} already sent, {len(self.generated)} generated but unsent, "
+            f"{len(self.uncertain)} possibly sent"
+        )
+        if self.uncertain:
+            # Re-sending could deliver them twice; check the Mailgun logs and remove the
+            # "uncertain" records from the checkpoint for any that really need sending
+            logging.warning(
+                f"Skipping {len(self.uncertain)} recipients whose email may already have been sent, "
+                f"review them manually: {', '.join(sorted(self.uncertain))}"
+            )
+
+    def _record(self, checkpoint, record):
+        checkpoint.write(json.dumps(record) + "\n")
+        checkpoint.flush()
+
+    async def run(self, recipients):
+        """
+        Generate and send emails to every recipient not already handled.
+
+        Args:
+            recipients (iterable): Dicts with "email" and optionally "name", e.g. from read_recipients
+
+        Returns:
+            dict: Counts of sent, skipped (already sent, possibly sent or duplicate), failed,
+                  uncertain (possibly sent in this run) and resumed emails
+        """
+        # One pooled async client for every Brain in the run
+        brain_client = create_async_client()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+
+            async def worker():
+                while True:
+                    recipient = await queue.get()
+                    try:
+                        await self._handle(recipient, checkpoint, brain_client)
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                # Recipients are streamed in, so huge lists are never loaded at once
+                queued = set()
+                for recipient in recipients:
+                    email = recipient["email"].lower()
+                    if email in self.sent or email in self.uncertain or email in queued:
+                        self.counts["skipped"] += 1
+                        continue
+                    queued.add(email)
+                    await queue.put(recipient)
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await brain_client.close()
+
+        return self.counts
+
+    async def _handle(self, recipient, checkpoint, brain_client):
+        """Generate (unless a previous run did) and send one email."""
+        email = recipient["email"].lower()
+        try:
+            body = self.generated.pop(email, None)
+            if body is None:
+                await self.rate_limiter.wait()
+                body = await Brain(
+                    shape_username=self.shape_username,
+                    user_id=recipient["email"],
+                    async_client=brain_client,
+                ).agenerate_reply(og_body=intro_email_context(recipient.get("name", "")))
+                self._record(checkpoint, {"email": email, "status": "generated", "body": body})
+            else:
+                self.counts["resumed"] += 1
+
+            data = shape_email_data(self.shape_username, self.domain, recipient["email"], [], self.subject, body)
+            await asyncio.to_thread(get_mailgun_client().send, data)
+            self._record(checkpoint, {"email": email, "status": "sent"})
+            self.sent.add(email)
+            self.counts["sent"] += 1
+        except MailgunSendUncertain as e:
+            # Mailgun may have accepted it, so it must not be retried automatically
+            logging.error(f"Outreach to {recipient['email']} may or may not have been sent: {str(e)}")
+            self._record(checkpoint, {"email": email, "status": "uncertain"})
+            self.uncertain.add(email)
+            self.counts["uncertain"] += 1
+        except Exception as e:
+            # Left out of the checkpoint's sent records, so the next run retries it
+            logging.error(f"Outreach to {recipient['email']} failed: {str(e)}")
+            self.counts["failed"] += 1
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Send an introduction email from a shape to a list of recipients")
+    parser.add_argument("recipients", help="CSV file with email and name columns")
+    parser.add_argument("--shape", required=True, help="Username of the shape sending the emails")
+    parser.add_argument("--subject", required=True, help="Subject of the emails")
+    parser.add_argument("--checkpoint", help="Progress file (default: <recipients>.progress.jsonl)")
+    parser.add_argument("--concurrency", type=int, help="Bodies generated at once")
+    parser.add_argument("--rate", type=int, help="Shapes API calls per minute")
+    args = parser.parse_args()
+
+    outreach = Outreach(
+        shape_username=args.shape,
+        subject=args.subject,
+        checkpoint_path=args.checkpoint or f"{args.recipients}.progress.jsonl",
+        concurrency=args.concurrency,
+        rate_per_minute=args.rate,
+    )
+    counts = asyncio.run(outreach.run(read_recipients(args.recipients)))
+    logging.info(f"Outreach finished: {counts}")
@@ -0,0 +1,237 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import logging
+import os
+import re
+import threading
+
+# Attachment blocks as produced by format_attachment
+_ATTACHMENT_BLOCK = re.compile(r"\s*--- ATTACHMENT: (.*?) ---\n(.*?)\n--- END ATTACHMENT ---\n*", re.S)
+
+# "On Mon, Jan 6, 2025 at 10:00 AM, Jane <jane@example.com> wrote:" (may wrap onto two lines)
+_REPLY_HEADER = re.compile(r"^\s*On\b.*\bwrote:\s*$", re.S)
+_ORIGINAL_MESSAGE = re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.I)
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+def format_attachment(name, text):
+    """Wrap attachment text in the markers the Brain looks for."""
+    return f"\n\n--- ATTACHMENT: {name} ---\n{text}\n--- END ATTACHMENT ---\n\n"
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of text without a tokenizer.
+
+    UTF-8 bytes / 4 is close to real BPE counts for English and errs on the
+    high side for other scripts, which is the safe direction for a budget.
+    """
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to about max_tokens, noting how much was kept."""
+    data = text.encode("utf-8")
+    max_bytes = max(max_tokens, 0) * 4
+    if len(data) <= max_bytes:
+        return text
+    kept = data[:max_bytes].decode("utf-8", errors="ignore")
+    return kept + f"\n[Truncated to fit the prompt budget: {len(kept)} of {len(text)} characters kept]"
+
+
+def strip_quoted_history(text):
+    """
+    Remove quoted reply history from an email body.
+
+    Drops ">"-quoted lines and everything below a reply header ("On ... wrote:",
+    "-----Original Message-----", or an Outlook "From:/Sent:" block). Forwarded
+    messages are kept, since they are usually the point of the email. If nothing
+    but history is left, the text is returned unchanged.
+    """
+    lines = text.split("\n")
+    kept = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(">"):
+            continue
+
+        if stripped.startswith("On ") and (
+            _REPLY_HEADER.match(line)
+            or (index + 1 < len(lines) and _REPLY_HEADER.match(line + " " + lines[index + 1]))
+        ):
+            break
+        if _ORIGINAL_MESSAGE.match(line):
+            break
+        if stripped.startswith("From:") and _is_outlook_reply_header(lines[index + 1:index + 6]):
+            break
+
+        kept.append(line)
+
+    result = "\n".join(kept).rstrip()
+    return result if result.strip() else text
+
+
+def _is_outlook_reply_header(following):
+    """Whether the lines after a "From:" line are an Outlook reply header (not a forward)."""
+    following = [line.strip() for line in following]
+    if not any(line.startswith("Sent:") for line in following):
+        return False
+    subject = next((line for line in following if line.startswith("Subject:")), "")
+    return not re.match(r"Subject:\s*(fw|fwd):", subject, re.I)
+
+
+def dedupe_paragraphs(text, min_chars=20, max_lines=10):
+    """
+    Drop repeated paragraphs, such as the same signature or disclaimer appearing
+    once per message in a thread. Only blocks of at least min_chars characters
+    and at most max_lines lines are considered, so short replies like "Yes." and
+    long content blocks are never dropped.
+    """
+    seen = set()
+    kept = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        key = " ".join(paragraph.split()).lower()
+        if len(key) >= min_chars and paragraph.count("\n") < max_lines:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(paragraph)
+    return "\n\n".join(kept)
+
+
+class PromptBudget:
+    """
+    Shrinks the email text given to the Shapes API to a token budget.
+
+    The message itself is cleaned first (quoted history and repeated signatures
+    removed). The message is then kept whole if it fits, and attachments share
+    what is left of the budget: small attachments are kept whole, and each large
+    one is truncated to an equal share of the remainder. Bytes removed at each
+    stage are counted in stats().
+    """
+
+    def __init__(self, max_tokens=None):
+        """
+        Initialize the PromptBudget.
+
+        Args:
+            max_tokens (int, optional): Estimated tokens allowed for the email text.
+                                        Defaults to PROMPT_TOKEN_BUDGET or 8000; 0 disables
+                                        truncation (cleanup still runs).
+        """
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.getenv("PROMPT_TOKEN_BUDGET", 8000))
+        self._lock = threading.Lock()
+        self._stats = {
+            "prompts": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "quoted_history_bytes": 0,
+            "signature_bytes": 0,
+            "truncated_bytes": 0,
+        }
+
+    def apply(self, og_body):
+        """
+        Budget an email body (with any appended attachment blocks).
+
+        Args:
+            og_body (str): The email body, before it is put into the prompt
+
+        Returns:
+            str: The reduced text, with attachment markers preserved
+        """
+        attachments = [(match.group(1), match.group(2)) for match in _ATTACHMENT_BLOCK.finditer(og_body)]
+        message = _ATTACHMENT_BLOCK.sub("\n", og_body).rstrip() if attachments else og_body
+
+        without_history = strip_quoted_history(message)
+        cleaned = dedupe_paragraphs(without_history)
+
+        truncated_message, truncated_attachments = cleaned, attachments
+        if self.max_tokens:
+            truncated_message = truncate_to_tokens(cleaned, self.max_tokens)
+            remaining = self.max_tokens - estimate_tokens(truncated_message)
+            truncated_attachments = self._fit_attachments(attachments, remaining)
+
+        result = truncated_message + "".join(
+            format_attachment(name, text) for name, text in truncated_attachments
+        )
+
+        self._record(og_body, message, without_history, cleaned, result)
+        return result
+
+    def _fit_attachments(self, attachments, remaining):
+        """Share the remaining budget between attachments, smallest first."""
+        sizes = sorted(range(len(attachments)), key=lambda i: len(attachments[i][1]))
+        fitted = list(attachments)
+        for position, index in enumerate(sizes):
+            name, text = attachments[index]
+            share = max(remaining, 0) // (len(attachments) - position)
+            fitted[index] = (name, truncate_to_tokens(text, share))
+            remaining -= estimate_tokens(fitted[index][1])
+        return fitted
+
+    def _record(self, og_body, message, without_history, cleaned, result):
+        """Update the byte counters and log what was saved for this prompt."""
+        size = lambda text: len(text.encode("utf-8"))
+        bytes_in, bytes_out = size(og_body), size(result)
+        quoted = size(message) - size(without_history)
+        signatures = size(without_history) - size(cleaned)
+        truncated = max(bytes_in - bytes_out - quoted - signatures, 0)
+
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["bytes_in"] += bytes_in
+            self._stats["bytes_out"] += bytes_out
+            self._stats["quoted_history_bytes"] += quoted
+            self._stats["signature_bytes"] += signatures
+            self._stats["truncated_bytes"] += truncated
+
+        if bytes_out < bytes_in:
+            logging.info(
+                f"Prompt budget: {bytes_in} -> {bytes_out} bytes "
+                f"(quoted history {quoted}, signatures {signatures}, truncation {truncated})"
+            )
+
+    def stats(self):
+        """Return the cumulative byte counters."""
+        with self._lock:
+            return dict(self._stats)
+
+
+_prompt_budget = None
+_prompt_budget_lock = threading.Lock()
+
+
+def get_prompt_budget():
+    """
+    Get the process-wide PromptBudget, creating it on first use.
+
+    Created lazily so the environment (.env) is loaded before it reads its settings.
+    """
+    global _prompt_budget
+    with _prompt_budget_lock:
+        if _prompt_budget is None:
+            _prompt_budget = PromptBudget()
+        return _prompt_budget
@@ -0,0 +1,169 @@
+"""
+MIT License
+
+Copyright (c) 2025 Shapes, Inc
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+# Marks a trie node where an ignore pattern ends
+_END = ""
+
+
+class SenderFilter:
+    """
+    Decides which addresses the shapes should not reply to (or CC).
+
+    An address is ignored if it ends with any ignore pattern (e.g. "@noreply.com"
+    or "@notifications.example.com") unless it is on the allow list exactly. The allow list
+    is a set and the ignore patterns are stored reversed in a trie, so checking an
+    address costs O(len(address)) however long the lists are. Matching is
+    case-insensitive.
+
+    The lists come from IGNORE_LIST/ALLOW_LIST (comma separated) and, if set,
+    SENDER_FILTER_FILE: a JSON file {"ignore": [...], "allow": [...]} that is
+    reloaded when it changes, without restarting the service.
+    """
+
+    def __init__(self, ignore_list=None, allow_list=None, path=None, check_interval=None):
+        """
+        Initialize the SenderFilter.
+
+        Args:
+            ignore_list (list, optional): Address suffixes to ignore. Defaults to IGNORE_LIST.
+            allow_list (list, optional): Exact addresses never ignored. Defaults to ALLOW_LIST.
+            path (str, optional): JSON file with more patterns. Defaults to SENDER_FILTER_FILE.
+            check_interval (float, optional): Seconds between checks of the file for changes.
+                                              Defaults to SENDER_FILTER_CHECK_INTERVAL or 5.
+        """
+        self.base_ignore = ignore_list if ignore_list is not None else os.getenv("IGNORE_LIST", "").split(",")
+        self.base_allow = allow_list if allow_list is not None else os.getenv("ALLOW_LIST", "").split(",")
+        self.path = path or os.getenv("SENDER_FILTER_FILE")
+        self.check_interval = check_interval or float(os.getenv("SENDER_FILTER_CHECK_INTERVAL", 5))
+
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._compile(self.base_ignore, self.base_allow)
+        self._reload_if_changed()
+
+    def should_ignore(self, email):
+        """
+        Check whether an address should be ignored.
+
+        Args:
+            email (str): The email address
+
+        Returns:
+            bool: True if the address matches an ignore pattern and isn't explicitly allowed
+        """
+        self._reload_if_changed()
+        email = email.lower()
+
+        # Snapshot, so a concurrent reload swaps both structures at once
+        allow, trie = self._allow, self._trie
+        if email in allow:
+            return False
+
+        node = trie
+        for char in reversed(email):
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def reload(self):
+        """Rebuild the matcher from the environment lists and SENDER_FILTER_FILE now."""
+        ignore_list, allow_list = list(self.base_ignore), list(self.base_allow)
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            ignore_list += data.get("ignore", [])
+            allow_list += data.get("allow", [])
+        self._compile(ignore_list, allow_list)
+
+    def _compile(self, ignore_list, allow_list):
+        """Build the allow set and the reversed-suffix trie, then swap them in."""
+        allow = {email.strip().lower() for email in allow_list if email.strip()}
+
+        trie = {}
+        patterns = 0
+        for pattern in ignore_list:
+            # Empty entries (e.g. IGNORE_LIST="") would otherwise match every address
+            pattern = pattern.strip().lower()
+            if not pattern:
+                continue
+            node = trie
+            for char in reversed(pattern):
+                node = node.setdefault(char, {})
+            node[_END] = True
+            patterns += 1
+
+        self._allow, self._trie = allow, trie
+        logging.info(f"Sender filter loaded: {len(allow)} allowed addresses, {patterns} ignore patterns")
+
+    def _reload_if_changed(self):
+        """Reload SENDER_FILTER_FILE when its modification time changes, checking at most every check_interval."""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            try:
+                self.reload()
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                # Keep the previous lists rather than failing every email on a bad edit
+                logging.error(f"Error reloading sender filter from {self.path}: {str(e)}")
+
+
+_sender_filter = None
+_sender_filter_lock = threading.Lock()
+
+
+def get_sender_filter():
+    """
+    Get the process-wide SenderFilter, creating it on first use.
+
+    Created lazily so the environment (.env) is loaded before it reads its settings.
+    """
+    global _sender_filter
+    with _sender_filter_lock:
+        if _sender_filter is None:
+            _sender_filter = SenderFilter()
+        return _sender_filter
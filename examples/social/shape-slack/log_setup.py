@@ -0,0 +1,74 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+
+def default_log_path():
+    """/app/logs/log.txt in the container, or ./logs/log.txt where /app isn't writable (e.g. run locally)"""
+    if os.access("/app/logs", os.W_OK) or (not os.path.exists("/app/logs") and os.access("/app", os.W_OK)):
+        return "/app/logs/log.txt"
+    return os.path.abspath(os.path.join("logs", "log.txt"))
+
+
+LOG_PATH = os.environ.get("LOG_PATH") or default_log_path()
+
+# Fields passed with extra={...} that are copied into each JSON log line
+CONTEXT_FIELDS = ("channel", "user", "event_id", "event_type")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, with the context fields the viewer filters on"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(path=LOG_PATH):
+    """
+    Route the root logger through a queue to a rotating JSON-lines file and stdout.
+
+    Logging calls only put the record on an in-memory queue; a listener thread does
+    the formatting and file writes, so the event loop never waits on disk.
+    Returns the started QueueListener (stop it on shutdown to flush the queue).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backupCount=int(os.environ.get("LOG_BACKUP_COUNT", 5)),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    return _listener
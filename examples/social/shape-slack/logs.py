@@ -1,18 +1,312 @@
 # logs.py
-from flask import render_template_string, request
+from jinja2 import Template
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from log_setup import LOG_PATH
+from urllib.parse import urlencode
+import asyncio
+import bisect
+import hashlib
+import hmac
+import json
+import logging
 import os
+import time
 
 # Generate a random secure token if none is provided in environment variables
 DEFAULT_SECRET = "secret-pwd"
 LOGS_SECRET = os.environ.get("LOGS_SECRET", DEFAULT_SECRET)
 LOGS_LINES = int(os.environ.get("LOGS_LINES", 100))
 
+# How long a logs page may keep streaming before the secret must be entered again
+STREAM_TOKEN_TTL = 12 * 60 * 60
+STREAM_POLL_INTERVAL = 1.0
+STREAM_HEARTBEAT_INTERVAL = 15.0
+# Most bytes of the log file read at once, so catching up after a rotation never loads the whole file
+STREAM_READ_BYTES = 256 * 1024
 
-def view_logs():
+
+def tail_lines(path, count, block_size=8192):
+    """
+    Return the last count complete lines of a file and the byte offset they end at.
+
+    Reads backwards from the end one block at a time, so the cost depends on the
+    lines returned, not on the size of the file.
+    """
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        end = file.tell()
+        position = end
+        data = b""
+        # count + 1 newlines guarantees the first returned line is complete
+        while position > 0 and data.count(b"\n") <= count:
+            read_size = min(block_size, position)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + data
+
+    # Leave a partial last line (still being written) for the stream to pick up
+    partial = len(data) - (data.rfind(b"\n") + 1)
+    if partial:
+        data = data[:-partial]
+        end -= partial
+
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-count:] if count else [], end
+
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+def parse_entry(line):
+    """Parse a JSON log line; lines that aren't JSON are treated as INFO messages"""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        entry = None
+    return entry if isinstance(entry, dict) else {"message": line, "level": "INFO"}
+
+
+def format_entry(entry):
+    """One readable line for the viewer: time, level, channel/user, message"""
+    parts = [entry.get("ts", ""), entry.get("level", "")]
+    parts += [f"{field}={entry[field]}" for field in ("channel", "user") if entry.get(field)]
+    parts.append(entry.get("message", ""))
+    return " ".join(part for part in parts if part)
+
+
+def sse_event(event_id, text):
+    """
+    One server-sent event. SSE ends a field at any CR, LF or CRLF, so each line
+    of text goes in its own data field (the browser joins them with newlines).
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return f"id: {event_id}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+def read_chunk(path, offset, size):
+    """Read up to size bytes of a file from offset"""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return file.read(size)
+
+
+def matches(entry, filters):
+    """Whether a parsed entry passes the viewer filters (minimum level, exact channel and user)"""
+    level = filters.get("level")
+    if level and entry.get("level") not in LEVELS[LEVELS.index(level):]:
+        return False
+    return all(entry.get(field) == filters[field] for field in ("channel", "user") if filters.get(field))
+
+
+class LogIndex:
+    """
+    Byte offsets of the lines in the log file, keyed by level, channel and user.
+
+    Built incrementally: each query first indexes only the lines appended since the
+    last one, and starts over when the file is rotated. A filtered view then reads
+    just the matching lines instead of scanning the whole file.
+
+    Offsets only ever grow, so every list stays sorted as lines are appended. Each
+    line goes in the list of every level at or below its own, so a minimum-level
+    filter is a single list. Once more than max_lines lines are indexed, the older
+    half is dropped.
+    """
+
+    def __init__(self, path, max_lines=200000):
+        self.path = path
+        self.max_lines = max_lines
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.indexed = 0
+        # "level" maps a level to the lines at that level or above
+        self.by_field = {"level": {level: [] for level in LEVELS}, "channel": {}, "user": {}}
+
+    async def update(self):
+        """Index the lines appended since the last call, reading in bounded chunks off the event loop"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._reset(None)
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.indexed:
+            self._reset(stat.st_ino)
+
+        while stat.st_size > self.indexed:
+            data = await asyncio.to_thread(
+                read_chunk, self.path, self.indexed, min(stat.st_size - self.indexed, STREAM_READ_BYTES)
+            )
+            # Only complete lines; a partial last line is indexed next time
+            complete = data.rfind(b"\n") + 1
+            if not complete:
+                if len(data) < STREAM_READ_BYTES:
+                    break
+                # A single line longer than a chunk is left out of the index
+                self.indexed += len(data)
+                continue
+            self._add_lines(data[:complete])
+
+        if len(self.by_field["level"][LEVELS[0]]) > self.max_lines:
+            self._compact()
+
+    def _add_lines(self, data):
+        offset = self.indexed
+        for raw_line in data.split(b"\n")[:-1]:
+            entry = parse_entry(raw_line.decode("utf-8", errors="replace"))
+            level = entry.get("level")
+            if level in LEVELS:
+                for at_or_below in LEVELS[:LEVELS.index(level) + 1]:
+                    self.by_field["level"][at_or_below].append(offset)
+            for field in ("channel", "user"):
+                value = entry.get(field)
+                if value:
+                    self.by_field[field].setdefault(value, []).append(offset)
+            offset += len(raw_line) + 1
+        self.indexed = offset
+
+    def _compact(self):
+        """Forget the older half of the indexed lines"""
+        every_line = self.by_field["level"][LEVELS[0]]
+        cutoff = every_line[len(every_line) - self.max_lines // 2]
+        for values in self.by_field.values():
+            for key, offsets in list(values.items()):
+                kept = offsets[bisect.bisect_left(offsets, cutoff):]
+                if kept or values is self.by_field["level"]:
+                    values[key] = kept
+                else:
+                    del values[key]
+
+    async def query(self, filters, count):
+        """Return the last count lines matching filters, and the offset the index ends at"""
+        await self.update()
+        candidates = []
+        if filters.get("level"):
+            candidates.append(self.by_field["level"][filters["level"]])
+        for field in ("channel", "user"):
+            if filters.get(field):
+                candidates.append(self.by_field[field].get(filters[field], []))
+
+        # Walk the smallest offset list backwards, checking membership in the others by bisection
+        candidates.sort(key=len)
+        selected = []
+        for offset in reversed(candidates[0]):
+            if all(contains(other, offset) for other in candidates[1:]):
+                selected.append(offset)
+                if len(selected) == count:
+                    break
+
+        lines = await asyncio.to_thread(read_lines_at, self.path, reversed(selected))
+        return lines, self.indexed
+
+
+def contains(offsets, offset):
+    """Whether a sorted list of offsets includes offset"""
+    index = bisect.bisect_left(offsets, offset)
+    return index < len(offsets) and offsets[index] == offset
+
+
+def read_lines_at(path, offsets):
+    """Read the lines starting at the given byte offsets"""
+    lines = []
+    with open(path, "rb") as file:
+        for offset in offsets:
+            file.seek(offset)
+            lines.append(file.readline().decode("utf-8", errors="replace").rstrip("\n"))
+    return lines
+
+
+log_index = LogIndex(LOG_PATH)
+
+
+def read_filters(params):
+    """Viewer filters from query or form parameters; unknown levels are ignored"""
+    level = (params.get("level") or "").upper()
+    return {
+        "level": level if level in LEVELS else "",
+        # Entries carry the raw Slack IDs; accept the "slack-channel-"/"slack-user-" forms sent to the API too
+        "channel": (params.get("channel") or "").strip().removeprefix("slack-channel-"),
+        "user": (params.get("user") or "").strip().removeprefix("slack-user-"),
+    }
+
+
+def stream_token(expires):
+    """Sign a stream expiry time with the logs secret, so the secret never goes in a URL"""
+    return hmac.new(LOGS_SECRET.encode(), f"logs-stream:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def token_valid(params):
+    """Whether params carry an unexpired stream token (issued with an authenticated logs page)"""
+    expires = params.get("expires") or ""
+    token = params.get("token") or ""
+    return expires.isdigit() and int(expires) >= time.time() and hmac.compare_digest(token, stream_token(expires))
+
+
+async def stream_logs(request):
+    """Server-sent events: push lines appended to the log file after a byte offset"""
+    if not token_valid(request.query_params):
+        return Response("Unauthorized", status_code=401)
+    filters = read_filters(request.query_params)
+
+    # EventSource sends the id of the last event it saw when it reconnects
+    offset = request.headers.get("last-event-id") or request.query_params.get("offset", "0")
+    offset = int(offset) if offset.isdigit() else 0
+
+    async def events():
+        nonlocal offset
+        last_sent = time.monotonic()
+        inode = None
+        while not await request.is_disconnected():
+            try:
+                stat = os.stat(LOG_PATH)
+                size = stat.st_size
+            except OSError:
+                stat, size = None, 0
+            if (stat and inode is not None and stat.st_ino != inode) or size < offset:
+                offset = 0  # The file was rotated or truncated
+            inode = stat.st_ino if stat else None
+
+            # Read in bounded chunks off the event loop; a large backlog (e.g. the whole
+            # file after a rotation) is sent a chunk at a time
+            while size > offset:
+                data = await asyncio.to_thread(read_chunk, LOG_PATH, offset, min(size - offset, STREAM_READ_BYTES))
+                # Only send complete lines; a partial last line is picked up next time
+                complete = data.rfind(b"\n") + 1
+                if not complete:
+                    if len(data) < STREAM_READ_BYTES:
+                        break
+                    # A single line longer than a chunk: skip it rather than stall on it
+                    offset += len(data)
+                    continue
+                for raw_line in data[:complete].split(b"\n")[:-1]:
+                    offset += len(raw_line) + 1
+                    entry = parse_entry(raw_line.decode("utf-8", errors="replace").rstrip("\r"))
+                    if matches(entry, filters):
+                        yield sse_event(offset, format_entry(entry))
+                        last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent > STREAM_HEARTBEAT_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+def render_template_string(source, **context):
+    """Render an inline Jinja2 template (autoescaped, like Flask's helper of the same name)."""
+    return HTMLResponse(Template(source, autoescape=True).render(**context))
+
+
+async def view_logs(request):
     # Debug - print what's being received
+    form = await request.form() if request.method == "POST" else {}
 
-    # Check if this is a POST request with the correct secret
-    if request.method != "POST" or request.form.get("logs_secret") != LOGS_SECRET:
+    # The secret is posted once; the filter form then authenticates with the stream token
+    authenticated = form.get("logs_secret") == LOGS_SECRET if request.method == "POST" else token_valid(request.query_params)
+    if not authenticated:
         # If not authenticated, show login form instead of logs
         html_template = """
         <!DOCTYPE html>
@@ -78,36 +372,41 @@ def view_logs():
         return render_template_string(html_template)
 
     # If authenticated, show logs
-    log_path = "/app/logs/log.txt"
+    filters = read_filters(request.query_params)
     last_lines = []
+    offset = 0
 
     # Check if log file exists
-    if os.path.exists(log_path):
+    if os.path.exists(LOG_PATH):
         try:
-            # Read the last N lines
-            with open(log_path, "r") as file:
-                # Load all lines and get the last N lines
-                all_lines = file.readlines()
-                last_lines = (
-                    all_lines[-LOGS_LINES:]
-                    if len(all_lines) > LOGS_LINES
-                    else all_lines
-                )
+            if any(filters.values()):
+                # Read only the matching lines, found through the offset index
+                raw_lines, offset = await log_index.query(filters, LOGS_LINES)
+            else:
+                # Read only the end of the file
+                raw_lines, offset = await asyncio.to_thread(tail_lines, LOG_PATH, LOGS_LINES)
+            last_lines = [format_entry(parse_entry(line)) for line in raw_lines]
         except Exception as e:
             error_msg = f"Error reading log file: {str(e)}"
-            print(error_msg)
+            logging.error(error_msg)
             last_lines = [error_msg]
     else:
         last_lines = ["Log file does not exist yet"]
-        print("Log file not found at:", log_path)
+        logging.warning(f"Log file not found at: {LOG_PATH}")
+
+    # New lines are streamed into the page instead of re-posting the secret to refresh it
+    if request.method == "POST":
+        expires = int(time.time()) + STREAM_TOKEN_TTL
+    else:
+        expires = int(request.query_params["expires"])
+    token = stream_token(expires)
 
-    # Create a simple HTML template to display the logs with the form to resubmit
+    # Create a simple HTML template to display the logs and stream new lines into it
     html_template = """
     <!DOCTYPE html>
     <html>
     <head>
         <title>Application Logs</title>
-        <meta http-equiv="refresh" content="60"> <!-- Auto-refresh every 60 seconds -->
         <style>
             body {
                 font-family: monospace;
@@ -126,35 +425,54 @@ def view_logs():
                 overflow-y: auto;
                 white-space: pre-wrap;
             }
+            .filters {
+                margin-bottom: 10px;
+            }
             .log-entry {
                 margin: 0;
                 padding: 2px 0;
                 border-bottom: 1px solid #444;
             }
-            .hidden-form {
-                display: none;
-            }
         </style>
     </head>
     <body>
         <h1>Last {{ LOGS_LINES }} Log Lines</h1>
-        <!-- Hidden form for auto-refresh with authentication -->
-        <form id="auth-form" class="hidden-form" method="POST" action="/logs">
-            <input type="hidden" name="logs_secret" value="{{ secret }}">
+        <form class="filters" method="GET" action="/logs">
+            <input type="hidden" name="expires" value="{{ expires }}">
+            <input type="hidden" name="token" value="{{ token }}">
+            <select name="level">
+                <option value="">Any level</option>
+                {% for level in levels %}
+                <option value="{{ level }}" {% if level == filters.level %}selected{% endif %}>{{ level }} and above</option>
+                {% endfor %}
+            </select>
+            <input type="text" name="channel" placeholder="Channel" value="{{ filters.channel }}">
+            <input type="text" name="user" placeholder="User" value="{{ filters.user }}">
+            <button type="submit">Filter</button>
         </form>
-        <div class="log-container">
+        <div class="log-container" id="log-container">
             {% for line in log_lines %}
             <div class="log-entry">{{ line }}</div>
             {% endfor %}
         </div>
         <script>
-            // Submit the form on refresh to maintain authentication
-            window.onload = function() {
-                // Auto-submit is handled by meta refresh, but we need this for manual refresh
-                window.addEventListener('focus', function() {
-                    document.getElementById('auth-form').submit();
-                });
+            // Append new log lines as the server pushes them, keeping the last LOGS_LINES
+            var container = document.getElementById('log-container');
+            var source = new EventSource('/logs/stream?{{ stream_query|safe }}');
+            source.onmessage = function(event) {
+                var atBottom = container.scrollTop + container.clientHeight >= container.scrollHeight - 5;
+                var entry = document.createElement('div');
+                entry.className = 'log-entry';
+                entry.textContent = event.data;
+                container.appendChild(entry);
+                while (container.children.length > {{ LOGS_LINES }}) {
+                    container.removeChild(container.firstChild);
+                }
+                if (atBottom) {
+                    container.scrollTop = container.scrollHeight;
+                }
             };
+            container.scrollTop = container.scrollHeight;
         </script>
     </body>
     </html>
@@ -163,6 +481,10 @@ def view_logs():
     return render_template_string(
         html_template,
         log_lines=last_lines,
-        secret=request.form.get("logs_secret"),
+        expires=expires,
+        token=token,
+        filters=filters,
+        levels=LEVELS,
+        stream_query=urlencode({"offset": offset, "expires": expires, "token": token, **filters}),
         LOGS_LINES=LOGS_LINES,
     )
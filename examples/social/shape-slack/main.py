@@ -1,26 +1,31 @@
+import logging
 import os
 import sys
-import asyncio
-from slack_bolt import App
-from slack_bolt.adapter.flask import SlackRequestHandler
-from flask import Flask, request, jsonify, request
+import time
+from contextlib import asynccontextmanager
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
+from slack_sdk.errors import SlackApiError
+from log_setup import setup_logging
+from workers import RateLimiter, RecentEvents, ReplyScheduler
 
 # Load environment variables
 load_dotenv()
 
-# Initialize your Slack Bolt app
-app = App(
+# Initialize your Slack Bolt app (async, so every event runs on the server's event loop)
+app = AsyncApp(
     token=os.environ.get("SLACK_BOT_TOKEN"),
     signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
 )
-
-# Initialize Flask app
-flask_app = Flask(__name__)
-handler = SlackRequestHandler(app)
+handler = AsyncSlackRequestHandler(app)
 
 # Initialize the Shapes API client
+# Shared by all events: its connection pool lives on the one long-lived event loop
 shapes_client = AsyncOpenAI(
     api_key=os.environ.get("SHAPESINC_API_KEY"),
     base_url="https://api.shapes.inc/v1/",
@@ -31,6 +36,24 @@ shape_username = os.getenv("SHAPESINC_SHAPE_USERNAME")
 DEFAULT_LOGS_SECRET = "default_secret"
 LOGS_SECRET = os.environ.get("LOGS_SECRET", DEFAULT_LOGS_SECRET)
 
+# "message" posts each reply once it is complete; "stream" posts a thread reply right away
+# and edits it as the text arrives, at most once per STREAM_UPDATE_INTERVAL seconds
+REPLY_MODE = os.environ.get("REPLY_MODE", "message")
+STREAM_UPDATE_INTERVAL = float(os.environ.get("STREAM_UPDATE_INTERVAL", 1.0))
+STREAM_PLACEHOLDER = "…"
+# chat.update is a Tier 3 method (about 50 calls a minute for the whole app), so the
+# edits of all streaming replies share this budget; edits over it are skipped
+CHAT_UPDATE_PER_MINUTE = float(os.environ.get("CHAT_UPDATE_PER_MINUTE", 45))
+chat_update_limiter = RateLimiter(CHAT_UPDATE_PER_MINUTE)
+
+
+def log_context(message_channel_id, message_user_id):
+    """Log extras for a message: the raw Slack IDs, which is what the log viewer filters on"""
+    return {
+        "channel": message_channel_id.removeprefix("slack-channel-"),
+        "user": message_user_id.removeprefix("slack-user-"),
+    }
+
 
 # Process messages with the Shapes API
 async def process_with_shapes(message_text, message_user_id, message_channel_id):
@@ -57,76 +80,237 @@ async def process_with_shapes(message_text, message_user_id, message_channel_id)
         if resp.choices and len(resp.choices) > 0:
             return resp.choices[0].message.content
         else:
-            print(f"No choices in response: {resp}")
+            logging.warning(
+                f"No choices in response: {resp}",
+                extra=log_context(message_channel_id, message_user_id),
+            )
             final_response = resp.choices[0].message.content
             return final_response
 
     except Exception as e:
-        print(f"Error processing with Shapes API: {e}")
+        logging.error(
+            f"Error processing with Shapes API: {e}",
+            extra=log_context(message_channel_id, message_user_id),
+        )
         return f"Error processing your message: {str(e)}"
 
 
+async def stream_with_shapes(message_text, message_user_id, message_channel_id):
+    """Yield the reply text as it is generated, or all at once if the API doesn't stream"""
+    context = log_context(message_channel_id, message_user_id)
+    streamed = False
+    try:
+        stream = await shapes_client.chat.completions.create(
+            model=f"shapesinc/{shape_username}",
+            messages=[{"role": "user", "content": message_text}],
+            extra_headers={
+                "X-User-Id": message_user_id,
+                "X-Channel-Id": message_channel_id,
+            },
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                streamed = True
+                yield delta
+    except Exception as e:
+        if streamed:
+            logging.error(f"Reply stream interrupted: {e}", extra=context)
+            yield "\n\n_(reply interrupted)_"
+            return
+        logging.warning(f"Streaming unavailable, requesting the full reply: {e}", extra=context)
+
+    if not streamed:
+        # The Shapes API may answer with a complete response only
+        yield await process_with_shapes(message_text, message_user_id, message_channel_id)
+
+
 # support more actions with Slack Bolt: https://github.com/slackapi/bolt-python
 
 
-# Listen for message events
-@app.message("")
-def message_handler(message, say):
-    """Handle any message in channels the bot is in"""
-    print(f"Received message: {message['text']}")
+async def generate_reply(job):
+    """Generate a reply with the Shapes API and post it (runs on the reply scheduler)"""
+    message, say, client = job
 
-    # Use asyncio to run the async function
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
     # here we use shapes client to process the message
     message_user_id = f"slack-user-{message['user']}"
     message_channel_id = f"slack-channel-{message['channel']}"
     message_text = message["text"]
-    response = loop.run_until_complete(
-        process_with_shapes(message_text, message_user_id, message_channel_id)
-    )
-    loop.close()
+
+    if REPLY_MODE == "stream":
+        await stream_reply(message, client, message_text, message_user_id, message_channel_id)
+        return
+
+    response = await process_with_shapes(message_text, message_user_id, message_channel_id)
 
     # Send the response back to Slack
-    say(response)
+    await say(response)
+
+
+async def stream_reply(message, client, message_text, message_user_id, message_channel_id):
+    """Post a placeholder in the message's thread and edit it as the reply streams in"""
+    posted = await client.chat_postMessage(
+        channel=message["channel"],
+        thread_ts=message.get("thread_ts") or message["ts"],
+        text=STREAM_PLACEHOLDER,
+    )
+    channel, ts = posted["channel"], posted["ts"]
+
+    text = ""
+    final_text = None
+    last_update = time.monotonic()
+    try:
+        async for delta in stream_with_shapes(message_text, message_user_id, message_channel_id):
+            text += delta
+            # Edit at most once per interval, and only while the shared chat.update budget allows;
+            # skipped edits lose nothing, the next one shows all the text so far
+            if time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL and chat_update_limiter.try_acquire():
+                await edit_reply(client, channel, ts, text.rstrip() + " " + STREAM_PLACEHOLDER)
+                last_update = time.monotonic()
+        final_text = text.strip() or "(no reply)"
+    finally:
+        # Never leave the placeholder behind, even if the stream or an edit failed
+        if final_text is None:
+            final_text = (text.strip() + "\n\n" if text.strip() else "") + "_(reply interrupted)_"
+        await edit_reply(client, channel, ts, final_text, final=True)
+
+
+async def edit_reply(client, channel, ts, text, final=False, attempts=5):
+    """
+    Edit a streamed reply with chat.update, honouring Slack's Retry-After when ratelimited.
+
+    An intermediate edit that is ratelimited is dropped; a final edit waits for the
+    shared budget and retries, since it is the reply the user is left with.
+    """
+    for _ in range(attempts if final else 1):
+        if final:
+            await chat_update_limiter.acquire()
+        try:
+            await client.chat_update(channel=channel, ts=ts, text=text)
+            return
+        except SlackApiError as e:
+            if e.response.get("error") != "ratelimited":
+                raise
+            retry_after = float(e.response.headers.get("Retry-After") or e.response.headers.get("retry-after") or 1)
+            chat_update_limiter.pause(retry_after)
+            logging.warning(f"chat.update ratelimited, pausing edits for {retry_after:.0f}s", extra={"channel": channel})
+    if final:
+        logging.error(f"Gave up editing reply {ts} after {attempts} ratelimited attempts", extra={"channel": channel})
+
+
+# Slack retries any event not acknowledged within 3 seconds, so events are acknowledged
+# right away and replies are generated in the background; event IDs catch the retries.
+# Replies within one channel or thread are generated in order; REPLY_WORKERS caps how
+# many Shapes API calls run at once across all channels
+recent_events = RecentEvents()
+reply_scheduler = ReplyScheduler(generate_reply, concurrency=int(os.environ.get("REPLY_WORKERS", 8)))
+
+
+# Listen for message events
+@app.message("")
+async def message_handler(message, say, body, client):
+    """Handle any message in channels the bot is in"""
+    context = {
+        "channel": message.get("channel"),
+        "user": message.get("user"),
+        "event_id": body.get("event_id"),
+    }
+    logging.info(f"Received message ({len(message.get('text') or '')} characters)", extra=context)
+
+    # Drop duplicate deliveries of an event we already queued
+    event_id = body.get("event_id")
+    if event_id and not recent_events.add(event_id):
+        logging.info(f"Ignoring duplicate event {event_id}", extra=context)
+        return
+
+    conversation = (message.get("channel"), message.get("thread_ts"))
+    if not reply_scheduler.submit(conversation, (message, say, client)):
+        logging.warning(f"Reply queue is full, dropping message {message.get('ts')}", extra=context)
 
 
 # Endpoint for Slack events
-@flask_app.route("/", methods=["POST"])
-def slack_events():
-    print(f"Received Slack event: {request.json}")
+async def slack_events(request):
+    body = await request.json()
+    # Only the event's identifiers are logged, not the whole payload
+    event = body.get("event") or {}
+    logging.debug(
+        f"Received Slack event {body.get('type')}",
+        extra={"event_id": body.get("event_id"), "event_type": event.get("type")},
+    )
     # parse the challeneged parameter
-    challenge = request.json.get("challenge")
-    event_type = request.json.get("type")
+    challenge = body.get("challenge")
+    event_type = body.get("type")
     if challenge and event_type == "url_verification":
         # respond to the challenge parameter quickly
-        challenge_response = jsonify({"challenge": challenge})
-        return challenge_response
-    return handler.handle(request)
+        return JSONResponse({"challenge": challenge})
+
+    # A retry of an event that is already being handled: acknowledge it without doing anything
+    retry_num = request.headers.get("X-Slack-Retry-Num")
+    if retry_num and recent_events.seen(body.get("event_id")):
+        logging.info(f"Ignoring retry {retry_num} of event {body.get('event_id')}", extra={"event_id": body.get("event_id")})
+        return Response(status_code=200)
+
+    return await handler.handle(request)
 
 
 # Health check endpoint
-@flask_app.route("/health", methods=["GET"])
-def health_check():
-    return jsonify({"status": "ok"})
+async def health_check(request):
+    return JSONResponse({"status": "ok", "replies": reply_scheduler.stats()})
 
 
 # view logs endpoint
-@flask_app.route("/logs", methods=["GET", "POST"])
-def logs_route():
+async def logs_route(request):
     from logs import view_logs
 
-    return view_logs()
+    return await view_logs(request)
+
+
+# stream new log lines to the logs page
+async def logs_stream_route(request):
+    from logs import stream_logs
+
+    return await stream_logs(request)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Logging is set up when the server starts rather than on import; log calls only
+    # enqueue records, and a background thread writes the JSON log file
+    log_listener = setup_logging()
+    yield
+    # Finish replies already queued before shutting down
+    await reply_scheduler.stop()
+    # Flush log records still on the queue
+    log_listener.stop()
+
+
+# ASGI application: serve with uvicorn (see entrypoint.sh)
+asgi_app = Starlette(
+    routes=[
+        Route("/", slack_events, methods=["POST"]),
+        Route("/health", health_check, methods=["GET"]),
+        Route("/logs", logs_route, methods=["GET", "POST"]),
+        Route("/logs/stream", logs_stream_route, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
 
 
 def main():
+    import uvicorn
+
+    # Started here too so the check below is logged; the lifespan reuses this listener
+    log_listener = setup_logging()
+
     # Check for Shapes API key
     if not os.environ.get("SHAPESINC_API_KEY"):
-        print("Error: SHAPESINC_API_KEY not found in environment variables")
+        logging.error("Error: SHAPESINC_API_KEY not found in environment variables")
+        log_listener.stop()
         sys.exit(1)
 
-    # Run the Flask app
-    flask_app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 3000)))
+    # Run the ASGI app; one process, one event loop, events handled concurrently
+    uvicorn.run(asgi_app, host="0.0.0.0", port=int(os.environ.get("PORT", 3000)))
 
 
 if __name__ == "__main__":
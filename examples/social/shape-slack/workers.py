@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+
+class RecentEvents:
+    """Remembers recently handled Slack event IDs so retried deliveries are dropped"""
+
+    def __init__(self, ttl=600, max_size=10000):
+        # Slack retries three times within about five minutes, so ten minutes covers them all
+        self.ttl = ttl
+        self.max_size = max_size
+        self._events = OrderedDict()
+
+    def seen(self, event_id):
+        """Return True if event_id was recorded within the TTL"""
+        recorded_at = self._events.get(event_id)
+        return recorded_at is not None and time.monotonic() - recorded_at < self.ttl
+
+    def add(self, event_id):
+        """Record event_id; returns False if it was already recorded (a duplicate)"""
+        if self.seen(event_id):
+            return False
+        self._events[event_id] = time.monotonic()
+        self._events.move_to_end(event_id)
+        while len(self._events) > self.max_size:
+            self._events.popitem(last=False)
+        return True
+
+
+class RateLimiter:
+    """
+    Spaces out calls to a rate-limited Slack method across all replies.
+
+    Slack's limits apply per app and method, not per message, so every reply
+    shares one limiter. A ratelimited response holds back all callers for its
+    Retry-After.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute
+        self._next = 0.0
+
+    def try_acquire(self):
+        """Take the next call slot if it is free now; returns False instead of waiting"""
+        now = time.monotonic()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+    async def acquire(self):
+        """Wait for the next call slot and take it"""
+        while not self.try_acquire():
+            await asyncio.sleep(self._next - time.monotonic())
+
+    def pause(self, seconds):
+        """Hold back every caller for seconds"""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+class ReplyScheduler:
+    """
+    Generates replies off the Slack request path, one at a time per conversation.
+
+    Jobs for the same conversation (a channel, or a thread within it) run in the
+    order they were submitted, so replies are posted in order. Different
+    conversations run in parallel, up to `concurrency` jobs at once across all of
+    them. Each conversation has a task only while it has jobs waiting. Once
+    max_pending jobs are queued or running, new jobs are rejected rather than
+    waited on, so the event that brought them is never held up.
+    """
+
+    def __init__(self, process, concurrency=8, max_pending=1000, slow_wait=30):
+        self.process = process
+        self.concurrency = concurrency
+        self.slow_wait = slow_wait
+        self._slots = asyncio.Semaphore(concurrency)
+        self.max_pending = max_pending
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._queues = {}
+        self._runners = {}
+        self._pending = 0
+        self._running = 0
+        self._started = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def stop(self, timeout=30):
+        """Let queued replies finish (up to timeout seconds), then stop the conversation tasks"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Stopping with {self._pending} replies still queued")
+        tasks = list(self._runners.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, key, job):
+        """
+        Queue job behind any earlier jobs for the conversation identified by key.
+
+        Returns False, without queueing it, if max_pending jobs are already queued or running.
+        """
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            return False
+        self._pending += 1
+        self._idle.clear()
+        self._queues.setdefault(key, deque()).append((time.monotonic(), job))
+        if key not in self._runners:
+            self._runners[key] = asyncio.create_task(self._run(key))
+        return True
+
+    async def _run(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                async with self._slots:
+                    submitted_at, job = queue.popleft()
+                    self._record_wait(key, time.monotonic() - submitted_at)
+                    self._running += 1
+                    try:
+                        await self.process(job)
+                    except Exception as e:
+                        logging.exception(f"Error generating reply: {e}")
+                    finally:
+                        self._running -= 1
+                        self._pending -= 1
+                        if not self._pending:
+                            self._idle.set()
+        finally:
+            # Nothing awaits between finding the queue empty and these deletes, so no job is lost
+            del self._queues[key]
+            del self._runners[key]
+
+    def _record_wait(self, key, wait):
+        self._started += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        if wait > self.slow_wait:
+            logging.warning(f"Reply for {key} waited {wait:.1f}s in the queue")
+
+    def stats(self):
+        """Queue depth and how long jobs waited before a reply started generating"""
+        now = time.monotonic()
+        oldest = min((queue[0][0] for queue in self._queues.values() if queue), default=now)
+        return {
+            "pending": self._pending,
+            "running": self._running,
+            "conversations": len(self._queues),
+            "concurrency": self.concurrency,
+            "started": self._started,
+            "rejected": self._rejected,
+            "avg_wait_seconds": round(self._total_wait / self._started, 3) if self._started else 0.0,
+            "max_wait_seconds": round(self._max_wait, 3),
+            "oldest_waiting_seconds": round(now - oldest, 3),
+        }
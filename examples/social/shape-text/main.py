@@ -24,10 +24,13 @@ SOFTWARE.
 
 import os
 import re
+import time
 import logging
 import requests
 import tempfile
+import threading
 import subprocess
+from contextlib import contextmanager
 from urllib.parse import urlparse
 from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse
@@ -66,6 +69,14 @@ operator_msg_sent = {}
 # Default operator shape username
 OPERATOR_SHAPE = os.environ.get("OPERATOR_SHAPE_USERNAME", "operator")
 
+# Seconds between typing indicator refreshes while a reply is being generated
+TYPING_INDICATOR_INTERVAL = float(os.environ.get("TYPING_INDICATOR_INTERVAL", 5))
+
+# Last time a typing indicator was sent to a recipient (monotonic clock)
+# Key: phone number, Value: timestamp
+typing_indicator_sent = {}
+typing_indicator_lock = threading.Lock()
+
 # Initialize Redis client if available and configured
 redis_client = None
 if REDIS_AVAILABLE:
@@ -303,21 +314,19 @@ def imsg_reply():
                 # Return acknowledgment to webhook
                 return {"status": "success"}
         
-        # For direct messages (not groups), send typing indicator
-        # Typing indicators are only supported for direct messages
-        if not group_id:
-            send_typing_indicator(user_num)
-            
         # Generate reply using Brain with selected shape
         brain = Brain(
             shape_username=shape_username,
             user_id=user_num,
         )
         
-        reply = brain.generate_reply(
-            message=incoming_msg,
-            x_channel_id=group_id,
-        )
+        # For direct messages (not groups), keep the typing indicator up while generating
+        # Typing indicators are only supported for direct messages
+        with keep_typing(user_num, enabled=not group_id):
+            reply = brain.generate_reply(
+                message=incoming_msg,
+                x_channel_id=group_id,
+            )
         
         # Send the response via Sendblue
         send_imessage(user_num, reply, group_id)
@@ -737,7 +746,8 @@ def send_typing_indicator(to):
         response = requests.post(
             "https://api.sendblue.co/api/send-typing-indicator",
             headers=headers,
-            json=payload
+            json=payload,
+            timeout=TYPING_INDICATOR_INTERVAL
         )
         
         # Raise exception for HTTP errors
@@ -752,6 +762,49 @@ def send_typing_indicator(to):
         return {"status": "ERROR", "error_message": str(e)}
 
 
+@contextmanager
+def keep_typing(to, enabled=True):
+    """
+    Keep a Sendblue typing indicator alive for as long as the context is active.
+    
+    Indicators are sent from a background thread so the reply is never delayed by
+    the Sendblue API, and are rate limited per recipient so overlapping replies
+    to the same number share one refresher cadence.
+    
+    Args:
+        to (str): The recipient's phone number
+        enabled (bool): Whether to send indicators at all (e.g. False for groups)
+    """
+    if not enabled:
+        yield
+        return
+    
+    stop = threading.Event()
+    
+    def refresh():
+        while not stop.is_set():
+            with typing_indicator_lock:
+                now = time.monotonic()
+                elapsed = now - typing_indicator_sent.get(to, 0.0)
+                due = elapsed >= TYPING_INDICATOR_INTERVAL
+                if due:
+                    typing_indicator_sent[to] = now
+                    elapsed = 0.0
+            
+            if due:
+                send_typing_indicator(to)
+            
+            stop.wait(TYPING_INDICATOR_INTERVAL - elapsed)
+    
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        # Don't join: an in-flight indicator request must not hold up the reply
+        stop.set()
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     debug = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
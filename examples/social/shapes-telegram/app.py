@@ -1,10 +1,6 @@
 from flask import Flask, render_template_string
 import logging
 import os
-import psutil
-import subprocess
-import threading
-import time
 
 # Set up logging
 logging.basicConfig(
@@ -74,6 +70,8 @@ def index():
 
 def check_bot_is_running():
     """Check if any python process is running with main.py in its cmdline"""
+    import psutil  # Only needed when the status page is rendered
+    
     for proc in psutil.process_iter(['cmdline']):
         try:
             if proc.info and proc.info['cmdline']:
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark bot.handle_message with fake Telegram and Shapes endpoints.
+
+Feeds synthetic updates (private chats, groups with auto-reply, mentions, plain
+group chatter, commands and unapproved chats) or recorded getUpdates JSON through
+the real handler and reports throughput and latency percentiles. Nothing is sent
+to Telegram or Shapes; both are replaced by fakes with configurable latency.
+
+Usage:
+    python benchmark.py [--updates N] [--concurrency C] [--shapes-latency S] [--telegram-latency S]
+    python benchmark.py --replay updates.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+# Placeholder credentials so config.py imports without a real deployment
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("SHAPES_API_KEY", "benchmark")
+
+from telegram import Chat, Message, MessageEntity, Update, User
+
+import bot
+from access_manager import AccessManager
+
+BOT_ID = 1000
+BOT_USERNAME = "benchbot"
+APPROVED_PRIVATE_CHAT = 2001
+APPROVED_GROUP_CHAT = -3001
+AUTO_REPLY_GROUP_CHAT = -3002
+UNAPPROVED_GROUP_CHAT = -4001
+
+class FakeBot:
+    """Stands in for telegram.Bot, answering API calls after a fixed delay."""
+
+    def __init__(self, latency: float):
+        self.id = BOT_ID
+        self.username = BOT_USERNAME
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    async def _call(self, method: str) -> bool:
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return True
+
+    async def send_message(self, *args, **kwargs) -> bool:
+        return await self._call("send_message")
+
+    async def send_chat_action(self, *args, **kwargs) -> bool:
+        return await self._call("send_chat_action")
+
+class FakeShapesClient:
+    """Stands in for ShapesClient, blocking its worker thread like a real completion."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_response(self, conversation_history: List[Dict[str, str]], **kwargs) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return "benchmark reply"
+
+def make_update(update_id: int, chat_id: int, chat_type: str, text: str,
+                entities: Optional[List[MessageEntity]] = None) -> Update:
+    """Build a text message update from a regular user."""
+    user = User(id=5000 + update_id % 50, first_name="Bench", is_bot=False, username=f"user{update_id % 50}")
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=chat_type),
+        from_user=user,
+        text=text,
+        entities=entities
+    )
+    return Update(update_id=update_id, message=message)
+
+def synthetic_updates(count: int, seed: int = 0) -> List[Tuple[str, Update]]:
+    """
+    Build a mixed workload of (scenario, update) pairs.
+
+    Scenarios are weighted roughly like a busy deployment: mostly group traffic,
+    much of it chatter the bot ignores.
+    """
+    mention = f"@{BOT_USERNAME}"
+    scenarios = [
+        ("private", 3, lambda i: make_update(i, APPROVED_PRIVATE_CHAT, Chat.PRIVATE, f"hello there {i}")),
+        ("group_auto_reply", 2, lambda i: make_update(i, AUTO_REPLY_GROUP_CHAT, Chat.SUPERGROUP, f"anyone around? {i}")),
+        ("group_mention", 2, lambda i: make_update(
+            i, APPROVED_GROUP_CHAT, Chat.SUPERGROUP, f"{mention} what do you think? {i}",
+            [MessageEntity(type=MessageEntity.MENTION, offset=0, length=len(mention))]
+        )),
+        ("group_chatter", 4, lambda i: make_update(i, APPROVED_GROUP_CHAT, Chat.SUPERGROUP, f"just chatting {i}")),
+        ("command", 1, lambda i: make_update(i, APPROVED_GROUP_CHAT, Chat.SUPERGROUP, f"{mention} reset")),
+        ("unapproved", 1, lambda i: make_update(i, UNAPPROVED_GROUP_CHAT, Chat.SUPERGROUP, f"{mention} hi {i}")),
+    ]
+
+    rng = random.Random(seed)
+    names = [name for name, _, _ in scenarios]
+    weights = [weight for _, weight, _ in scenarios]
+    builders = {name: build for name, _, build in scenarios}
+
+    updates = []
+    for i in range(1, count + 1):
+        name = rng.choices(names, weights)[0]
+        updates.append((name, builders[name](i)))
+    return updates
+
+def replayed_updates(path: str) -> List[Tuple[str, Update]]:
+    """Load recorded updates, one getUpdates JSON object per line."""
+    updates = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                updates.append(("replay", Update.de_json(json.loads(line), None)))
+    return updates
+
+def make_context(fake_bot: FakeBot, shapes_client: FakeShapesClient, access_file: str) -> SimpleNamespace:
+    """Build the minimal handler context: the bot plus pre-populated bot_data."""
+    context = SimpleNamespace(bot=fake_bot, bot_data={
+        "shapes_client": shapes_client,
+        "access_manager": AccessManager(access_file=access_file, admin_password="benchmark"),
+    })
+
+    conversation_manager = bot.get_conversation_manager(context)
+    conversation_manager.enable_auto_reply(conversation_manager.get_conversation_id(AUTO_REPLY_GROUP_CHAT))
+    return context
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def run_benchmark(updates: List[Tuple[str, Update]], context: SimpleNamespace,
+                        concurrency: int) -> Tuple[float, Dict[str, List[float]]]:
+    """
+    Push every update through bot.handle_message.
+
+    Returns:
+        Tuple of (wall clock seconds, handler latencies in seconds per scenario)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def process(scenario: str, update: Update) -> None:
+        update.effective_message.set_bot(context.bot)
+        async with semaphore:
+            start = time.perf_counter()
+            await bot.handle_message(update, context)
+            latencies[scenario].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(scenario, update) for scenario, update in updates))
+    return time.perf_counter() - start, latencies
+
+def print_report(elapsed: float, latencies: Dict[str, List[float]], fake_bot: FakeBot,
+                 shapes_client: FakeShapesClient) -> None:
+    """Print throughput, latency percentiles per scenario and fake API call counts."""
+    all_latencies = [value for values in latencies.values() for value in values]
+    print(f"Processed {len(all_latencies)} updates in {elapsed:.2f}s "
+          f"({len(all_latencies) / elapsed:.1f} updates/sec)\n")
+
+    print(f"{'scenario':<18} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    rows = sorted(latencies.items()) + [("all", all_latencies)]
+    for scenario, values in rows:
+        print(f"{scenario:<18} {len(values):>6} "
+              f"{percentile(values, 50) * 1000:>9.2f} {percentile(values, 90) * 1000:>9.2f} "
+              f"{percentile(values, 99) * 1000:>9.2f} {statistics.mean(values) * 1000:>9.2f}")
+
+    calls = ", ".join(f"{method}={count}" for method, count in sorted(fake_bot.calls.items()))
+    print(f"\nShapes completions: {shapes_client.calls}, Telegram calls: {calls or 'none'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Telegram message handler")
+    parser.add_argument("--updates", type=int, default=2000, help="Number of synthetic updates")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Updates handled at once (1 matches the default sequential Application)")
+    parser.add_argument("--shapes-latency", type=float, default=0.0, help="Seconds per fake Shapes completion")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Seconds per fake Telegram API call")
+    parser.add_argument("--replay", help="JSONL file of recorded updates to use instead of synthetic ones")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic workload mix")
+    args = parser.parse_args()
+
+    # The handler logs every response decision; keep the report readable
+    logging.disable(logging.INFO)
+
+    fake_bot = FakeBot(args.telegram_latency)
+    shapes_client = FakeShapesClient(args.shapes_latency)
+    updates = replayed_updates(args.replay) if args.replay else synthetic_updates(args.updates, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        access_file = os.path.join(tmp_dir, "approved_chats.json")
+        with open(access_file, 'w') as f:
+            json.dump([APPROVED_PRIVATE_CHAT, APPROVED_GROUP_CHAT, AUTO_REPLY_GROUP_CHAT], f)
+
+        context = make_context(fake_bot, shapes_client, access_file)
+        elapsed, latencies = asyncio.run(run_benchmark(updates, context, args.concurrency))
+
+    print_report(elapsed, latencies, fake_bot, shapes_client)
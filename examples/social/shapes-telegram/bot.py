@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import Dict, Optional, Set, Tuple, List, Any
@@ -15,7 +16,7 @@ from telegram.ext import (
 from config import (
     TELEGRAM_TOKEN, WELCOME_MESSAGE, 
     RATE_LIMIT_MESSAGE, 
-    BOT_ADMIN_PASSWORD, ACCESS_CHECK_ENABLED
+    BOT_ADMIN_PASSWORD, ACCESS_CHECK_ENABLED, TELEGRAM_POOL_SIZE
 )
 
 # Constants that were removed from config
@@ -24,20 +25,54 @@ from conversation_manager import ConversationManager
 from shapes_client import ShapesClient, RateLimitExceeded
 from utils import extract_command_for_bot, is_bot_mentioned, is_reply_to_bot, get_user_identifier
 from access_manager import AccessManager
+from typing_indicator import TypingIndicator
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Initialize global instances
-conversation_manager = ConversationManager()
-shapes_client = ShapesClient()
-access_manager = AccessManager(admin_password=BOT_ADMIN_PASSWORD)
+# Each Application (one per bot token) keeps its own components in bot_data, so one
+# process can host many bots. Components are created on first use so importing this
+# module and starting a bot stay cheap (no API client or access file I/O up front).
+def get_conversation_manager(context: ContextTypes.DEFAULT_TYPE) -> ConversationManager:
+    """Get this bot's conversation manager, creating it on first use."""
+    if "conversation_manager" not in context.bot_data:
+        context.bot_data["conversation_manager"] = ConversationManager()
+    return context.bot_data["conversation_manager"]
 
-# Track users who have received the welcome message
-welcomed_users: Set[int] = set()
+def get_shapes_client(context: ContextTypes.DEFAULT_TYPE) -> ShapesClient:
+    """Get this bot's Shapes client, creating it on first use."""
+    if "shapes_client" not in context.bot_data:
+        context.bot_data["shapes_client"] = ShapesClient(
+            model=context.bot_data.get("shapes_model"),
+            api_key=context.bot_data.get("shapes_api_key")
+        )
+    return context.bot_data["shapes_client"]
+
+def get_access_manager(context: ContextTypes.DEFAULT_TYPE) -> AccessManager:
+    """Get this bot's access manager, loading its approved chats on first use."""
+    if "access_manager" not in context.bot_data:
+        context.bot_data["access_manager"] = AccessManager(
+            access_file=context.bot_data.get("access_file", "approved_chats.json"),
+            admin_password=context.bot_data.get("admin_password") or BOT_ADMIN_PASSWORD
+        )
+    return context.bot_data["access_manager"]
+
+def get_typing_indicator(context: ContextTypes.DEFAULT_TYPE) -> TypingIndicator:
+    """Get this bot's typing indicator."""
+    if "typing_indicator" not in context.bot_data:
+        context.bot_data["typing_indicator"] = TypingIndicator()
+    return context.bot_data["typing_indicator"]
 
-# Track users in password approval flow
-users_in_approval_flow: Dict[int, Dict[str, Any]] = {}
+def get_welcomed_users(context: ContextTypes.DEFAULT_TYPE) -> Set[int]:
+    """Get the users who have received this bot's welcome message."""
+    return context.bot_data.setdefault("welcomed_users", set())
+
+def get_approval_flows(context: ContextTypes.DEFAULT_TYPE) -> Dict[int, Dict[str, Any]]:
+    """Get the users currently in this bot's password approval flow."""
+    return context.bot_data.setdefault("users_in_approval_flow", {})
+
+# Number of replies currently being generated or sent
+in_flight_generations = 0
 
 async def get_access_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the getaccess command to provide users with their chat ID."""
@@ -83,7 +118,7 @@ async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     
     # Start the direct approval flow
-    users_in_approval_flow[user_id] = {"step": "direct_chat_id", "type": "approve"}
+    get_approval_flows(context)[user_id] = {"step": "direct_chat_id", "type": "approve"}
     
     await update.effective_message.reply_text(
         "Please enter the chat ID you want to approve directly:"
@@ -107,7 +142,7 @@ async def revoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     
     # Start the revoke flow
-    users_in_approval_flow[user_id] = {"step": "revoke_chat_id", "type": "revoke"}
+    get_approval_flows(context)[user_id] = {"step": "revoke_chat_id", "type": "revoke"}
     
     await update.effective_message.reply_text(
         "Please enter the chat ID you want to revoke access for:"
@@ -131,7 +166,7 @@ async def give_access_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     
     # Start the approval flow
-    users_in_approval_flow[user_id] = {"step": "chat_id", "type": "giveaccess"}
+    get_approval_flows(context)[user_id] = {"step": "chat_id", "type": "giveaccess"}
     
     await update.effective_message.reply_text(
         "Please enter the chat ID you want to approve.\n\n"
@@ -151,6 +186,7 @@ async def handle_approval_flow(update: Update, context: ContextTypes.DEFAULT_TYP
         return False
     
     user_id = update.effective_user.id
+    users_in_approval_flow = get_approval_flows(context)
     
     # Check if user is in approval flow
     if user_id not in users_in_approval_flow:
@@ -240,10 +276,10 @@ async def handle_approval_flow(update: Update, context: ContextTypes.DEFAULT_TYP
         chat_id = flow_state["chat_id"]
         
         # Register the chat ID for approval
-        access_manager.register_pending_approval(user_id, chat_id)
+        get_access_manager(context).register_pending_approval(user_id, chat_id)
         
         # Try to approve with the provided password
-        result = access_manager.approve_chat(user_id, password)
+        result = get_access_manager(context).approve_chat(user_id, password)
         
         # Remove user from approval flow
         del users_in_approval_flow[user_id]
@@ -260,7 +296,7 @@ async def handle_approval_flow(update: Update, context: ContextTypes.DEFAULT_TYP
         chat_id = flow_state["chat_id"]
         
         # Try to directly approve with the provided password
-        result = access_manager.direct_approve_chat(chat_id, password)
+        result = get_access_manager(context).direct_approve_chat(chat_id, password)
         
         # Remove user from approval flow
         del users_in_approval_flow[user_id]
@@ -277,7 +313,7 @@ async def handle_approval_flow(update: Update, context: ContextTypes.DEFAULT_TYP
         chat_id = flow_state["chat_id"]
         
         # Try to revoke access with the provided password
-        result = access_manager.revoke_access(chat_id, password)
+        result = get_access_manager(context).revoke_access(chat_id, password)
         
         # Remove user from approval flow
         del users_in_approval_flow[user_id]
@@ -299,6 +335,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     
     # If this is a private chat and the user hasn't been welcomed, send the welcome message
+    welcomed_users = get_welcomed_users(context)
     if update.effective_chat.type == "private" and user_id not in welcomed_users:
         await update.effective_message.reply_text(WELCOME_MESSAGE)
         welcomed_users.add(user_id)
@@ -309,11 +346,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
     
     # Enable auto-reply for this conversation
-    conversation_id = conversation_manager.get_conversation_id(
+    conversation_id = get_conversation_manager(context).get_conversation_id(
         chat_id, 
         update.effective_message.message_thread_id
     )
-    conversation_manager.enable_auto_reply(conversation_id)
+    get_conversation_manager(context).enable_auto_reply(conversation_id)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -333,7 +370,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
     
     # Generate a unique conversation ID for this context
-    conversation_id = conversation_manager.get_conversation_id(
+    conversation_id = get_conversation_manager(context).get_conversation_id(
         chat_id, 
         message.message_thread_id
     )
@@ -341,7 +378,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Always store message in context (for all users) if it has text content
     # This ensures we capture the full conversation for context
     if message.text and update.effective_chat.type in ["group", "supergroup"]:
-        conversation_manager.add_message(
+        get_conversation_manager(context).add_message(
             conversation_id=conversation_id,
             role="user",
             content=message.text,
@@ -379,22 +416,22 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
         
         # These commands only work for approved chats
-        if access_manager.is_chat_approved(chat_id) or not ACCESS_CHECK_ENABLED:
+        if get_access_manager(context).is_chat_approved(chat_id) or not ACCESS_CHECK_ENABLED:
             if command == "start":
                 # Enable auto-reply for this conversation
-                conversation_manager.enable_auto_reply(conversation_id)
+                get_conversation_manager(context).enable_auto_reply(conversation_id)
                 await message.reply_text("Auto-reply mode enabled. I'll respond to all messages in this chat.")
                 return
                 
             elif command == "stop":
                 # Disable auto-reply for this conversation
-                conversation_manager.disable_auto_reply(conversation_id)
+                get_conversation_manager(context).disable_auto_reply(conversation_id)
                 await message.reply_text("Auto-reply mode disabled. I'll only respond when mentioned or replied to.")
                 return
                 
             elif command == "reset":
                 # Reset the conversation history
-                conversation_manager.reset_conversation(conversation_id)
+                get_conversation_manager(context).reset_conversation(conversation_id)
                 await message.reply_text("Conversation history has been reset.")
                 return
     
@@ -413,7 +450,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
     
     # Check if this chat has access (if access control is enabled)
-    if ACCESS_CHECK_ENABLED and not access_manager.is_chat_approved(chat_id):
+    if ACCESS_CHECK_ENABLED and not get_access_manager(context).is_chat_approved(chat_id):
         # Reply with access info for unapproved chats
         if update.effective_chat.type != "private":
             # For group chats, tell them how to get access
@@ -441,7 +478,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         should_respond = True
     # For group chats and other chat types, check conditions
     else:
-        auto_reply_enabled = conversation_manager.is_auto_reply_enabled(conversation_id)
+        auto_reply_enabled = get_conversation_manager(context).is_auto_reply_enabled(conversation_id)
         bot_mentioned = is_bot_mentioned(context.bot, message)
         reply_to_bot = is_reply_to_bot(context.bot, message)
         
@@ -464,64 +501,118 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # For private chats, we need to add the message to the context here
     # For group chats, we already added it at the beginning of the function
     if update.effective_chat.type == "private":
-        conversation_manager.add_message(
+        get_conversation_manager(context).add_message(
             conversation_id=conversation_id,
             role="user",
             content=message.text,
             user_id=user_id
         )
     
-    # Send "typing..." indicator
-    await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-    
+    # Count this reply as in flight until it has been delivered, so shutdown can drain it
+    global in_flight_generations
+    in_flight_generations += 1
     try:
-        # Get conversation history
-        conversation_history = conversation_manager.get_conversation_history(conversation_id)
+        try:
+            # Get conversation history
+            conversation_history = get_conversation_manager(context).get_conversation_history(conversation_id)
         
-        # Generate response using Shapes Inc LLM through OpenAI compatibility layer
-        # No system prompt required as backend handles it
-        ai_response = shapes_client.generate_response(
-            conversation_history=conversation_history
-        )
+            # Keep the "typing..." indicator alive only while the reply is being generated
+            async with get_typing_indicator(context).keep_typing(context.bot, chat_id, message.message_thread_id):
+                # Generate response using Shapes Inc LLM through OpenAI compatibility layer
+                # No system prompt required as backend handles it
+                # Run in a worker thread so the event loop (and the typing refresher) keeps running
+                ai_response = await asyncio.to_thread(
+                    get_shapes_client(context).generate_response,
+                    conversation_history=conversation_history
+                )
         
-        # Save the assistant response to conversation history
-        conversation_manager.add_message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=ai_response
-        )
+            # Save the assistant response to conversation history
+            get_conversation_manager(context).add_message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=ai_response
+            )
         
-        # Send the main response
-        await message.reply_text(ai_response, parse_mode=ParseMode.MARKDOWN)
+            # Send the main response
+            await message.reply_text(ai_response, parse_mode=ParseMode.MARKDOWN)
         
-    except RateLimitExceeded:
-        await message.reply_text(RATE_LIMIT_MESSAGE)
-    except Exception as e:
-        logger.error(f"Error generating response: {str(e)}")
+        except RateLimitExceeded:
+            await message.reply_text(RATE_LIMIT_MESSAGE)
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
         
-        # Provide a user-friendly error message based on the type of error
-        if "API key" in str(e).lower() or "authorization" in str(e).lower():
-            error_msg = "Sorry, there seems to be an issue with the API key. Please check your Shapes Inc API key."
-        elif "failed to communicate" in str(e).lower():
-            error_msg = "Sorry, I'm having trouble connecting to the Shapes. Please try again in a moment."
-        elif "rate limit" in str(e).lower():
-            error_msg = RATE_LIMIT_MESSAGE
-        elif "invalid response" in str(e).lower():
-            error_msg = "Sorry, I received an unexpected response from Shapes. This could be due to a temporary service issue."
-        else:
-            # For other errors, give a generic message
-            error_msg = "Sorry, I encountered an error with Shapes. Please try again later."
+            # Provide a user-friendly error message based on the type of error
+            if "API key" in str(e).lower() or "authorization" in str(e).lower():
+                error_msg = "Sorry, there seems to be an issue with the API key. Please check your Shapes Inc API key."
+            elif "failed to communicate" in str(e).lower():
+                error_msg = "Sorry, I'm having trouble connecting to the Shapes. Please try again in a moment."
+            elif "rate limit" in str(e).lower():
+                error_msg = RATE_LIMIT_MESSAGE
+            elif "invalid response" in str(e).lower():
+                error_msg = "Sorry, I received an unexpected response from Shapes. This could be due to a temporary service issue."
+            else:
+                # For other errors, give a generic message
+                error_msg = "Sorry, I encountered an error with Shapes. Please try again later."
             
-        await message.reply_text(error_msg)
+            await message.reply_text(error_msg)
+    finally:
+        in_flight_generations -= 1
 
-def create_and_run_bot():
-    """Create and start the Telegram bot."""
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+async def drain_generations(timeout: float) -> bool:
+    """
+    Wait for in-flight replies to be generated and delivered.
+    
+    Args:
+        timeout: Maximum number of seconds to wait
+        
+    Returns:
+        Boolean indicating whether all replies finished before the timeout
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while in_flight_generations and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    return in_flight_generations == 0
+
+def build_application(token: Optional[str] = None,
+                      shapes_model: Optional[str] = None,
+                      access_file: str = "approved_chats.json",
+                      admin_password: Optional[str] = None,
+                      shapes_api_key: Optional[str] = None) -> Application:
+    """
+    Create a Telegram Application with all handlers registered.
+    
+    Args:
+        token: The Telegram bot token (defaults to TELEGRAM_TOKEN)
+        shapes_model: The Shapes model this bot talks to (defaults to SHAPES_MODEL)
+        access_file: Path to this bot's approved chats JSON file
+        admin_password: This bot's admin password (defaults to BOT_ADMIN_PASSWORD)
+        shapes_api_key: This bot's Shapes API key (defaults to SHAPES_API_KEY)
+        
+    Returns:
+        The configured Application, not yet started
+    """
+    application = (
+        Application.builder()
+        .token(token or TELEGRAM_TOKEN)
+        .connection_pool_size(TELEGRAM_POOL_SIZE)
+        .build()
+    )
+    
+    # Per-bot settings, read lazily by the get_* component helpers above
+    application.bot_data["shapes_model"] = shapes_model
+    application.bot_data["access_file"] = access_file
+    application.bot_data["admin_password"] = admin_password
+    application.bot_data["shapes_api_key"] = shapes_api_key
     
     # Add handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(MessageHandler(filters.ALL, handle_message))
+    return application
+
+def create_and_run_bot():
+    """Create and start the Telegram bot."""
+    application = build_application()
     
     # Start the Bot
     logger.info("Starting bot...")
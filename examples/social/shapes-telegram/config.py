@@ -3,12 +3,22 @@ import os
 # Telegram Bot Configuration
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 
+# Optional JSON file listing several bots to run in one process (see run.py)
+# Format: [{"token": "...", "model": "shapesinc/...", "access_file": "...", "admin_password": "..."}]
+BOTS_FILE = os.environ.get("BOTS_FILE")
+
+# Max concurrent Telegram API connections per bot (kept small so many bots fit in one process)
+TELEGRAM_POOL_SIZE = int(os.environ.get("TELEGRAM_POOL_SIZE", 4))
+
 # Shapes Inc API Configuration
 SHAPES_API_KEY = os.environ.get("SHAPES_API_KEY", "")
 SHAPES_API_BASE = "https://api.shapes.inc/v1"
 # Use environment variable for model name with a default example that doesn't reveal your actual model
 SHAPES_MODEL = os.environ.get("SHAPES_MODEL", "shapes-model/example-model")   # The Shapes Inc model to use
 
+# Connection pool shared by every bot's Shapes client in the process
+SHAPES_MAX_CONNECTIONS = int(os.environ.get("SHAPES_MAX_CONNECTIONS", 100))
+
 # Bot Behavior Configuration
 MAX_CONTEXT_MESSAGES = 1  # Only use the current message as the backend handles memory
 
@@ -37,6 +47,9 @@ RATE_LIMIT_MESSAGE = "sorry I've hit a rate limit, dude blame Shapes Inc okay"
 # Default timeout for API requests (in seconds)
 REQUEST_TIMEOUT = 60
 
+# Seconds between "typing..." refreshes while a reply is generated (Telegram clears it after ~5s)
+TYPING_REFRESH_INTERVAL = 4
+
 # Access control
 BOT_ADMIN_PASSWORD = os.environ.get("BOT_ADMIN_PASSWORD", "change-this-password")
 ACCESS_CHECK_ENABLED = True  # Set to False to disable access checks completely
@@ -3,7 +3,13 @@ import logging
 import os
 
 from bot import create_and_run_bot
-from app import app  # Import the Flask app for gunicorn
+
+def __getattr__(name):
+    """Import the Flask app for gunicorn (main:app) only when it is asked for."""
+    if name == "app":
+        from app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     # Set up logging
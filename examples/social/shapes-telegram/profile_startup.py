@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Report which imports make the bot slow to start.
+
+Runs `python -X importtime` on the entry point in a fresh interpreter and prints
+the slowest imports by cumulative time, so regressions in startup are easy to spot.
+
+Usage: python profile_startup.py [module] [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+def profile_imports(module: str) -> List[Tuple[int, int, str]]:
+    """
+    Import a module in a fresh interpreter with import timing enabled.
+
+    Args:
+        module: The module to import (e.g. "main")
+
+    Returns:
+        List of (self_us, cumulative_us, name) tuples, one per imported module
+    """
+    # Placeholder credentials so config.py imports the same way it does in production
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_TOKEN", "profile-startup")
+    env.setdefault("SHAPES_API_KEY", "profile-startup")
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        # Format: "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        timings.append((int(fields[0]), int(fields[1]), fields[2].rstrip()))
+    return timings
+
+def print_report(module: str, timings: List[Tuple[int, int, str]], top: int) -> None:
+    """Print the total import time and the slowest imports by cumulative time."""
+    total_us = sum(self_us for self_us, _, _ in timings)
+    print(f"Importing {module}: {total_us / 1000:.1f} ms across {len(timings)} modules\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+
+    for self_us, cumulative_us, name in sorted(timings, key=lambda t: t[1], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile import time of the bot entry point")
+    parser.add_argument("module", nargs="?", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    print_report(args.module, profile_imports(args.module), args.top)
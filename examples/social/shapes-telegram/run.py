@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 """
-Ultra simple script that runs both a web server and the bot in a single process.
-This is meant to be the most reliable way to deploy on Replit.
+Runs the Telegram bot(s) and the HTTP status server in a single process.
+
+Everything shares one asyncio event loop: the status server answers Replit's (or
+any load balancer's) HTTP checks while the bots poll Telegram. Set BOTS_FILE to
+host many bot tokens / Shapes models in one process, and SHARD_COUNT/SHARD_INDEX
+to split that list across several processes. On SIGINT/SIGTERM the bots stop
+taking new updates, drain replies that are still being generated, and only then
+shut down.
 """
+import asyncio
+import json
 import logging
 import os
-import subprocess
-import threading
-import time
+import signal
+from typing import Any, Dict, List
 
 # Set up logging
 logging.basicConfig(
@@ -16,46 +23,129 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_http_server():
-    """Run a simple HTTP server on port 5000 to satisfy Replit."""
-    logger.info("Starting HTTP server on port 5000...")
-    try:
-        # Try to run Python's built-in HTTP server
-        subprocess.Popen(["python", "-m", "http.server", "5000"])
-        logger.info("HTTP server started successfully.")
-    except Exception as e:
-        logger.error(f"Failed to start HTTP server: {e}")
+HTTP_PORT = int(os.environ.get("PORT", 5000))
+DRAIN_TIMEOUT = 30  # Maximum seconds to wait for in-flight replies on shutdown
+
+# Run only every SHARD_COUNT-th bot from BOTS_FILE, starting at SHARD_INDEX
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 1))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", 0))
+
+def load_bot_configs() -> List[Dict[str, Any]]:
+    """
+    Load the bots this process should run.
+    
+    Reads BOTS_FILE if set, otherwise runs the single bot configured through
+    TELEGRAM_TOKEN and SHAPES_MODEL.
+    
+    Returns:
+        List of keyword arguments for bot.build_application, one per bot
+    """
+    from config import BOTS_FILE, TELEGRAM_TOKEN
+    
+    if not BOTS_FILE:
+        return [{"token": TELEGRAM_TOKEN}]
+    
+    with open(BOTS_FILE, 'r') as f:
+        entries = json.load(f)
+    
+    configs = []
+    for index, entry in enumerate(entries):
+        if index % SHARD_COUNT != SHARD_INDEX:
+            continue
         
-def run_telegram_bot():
-    """Run the Telegram bot."""
-    logger.info("Starting Telegram bot...")
+        # The numeric bot ID is the part of the token before the colon (not secret)
+        bot_id = entry["token"].split(":", 1)[0]
+        configs.append({
+            "token": entry["token"],
+            "shapes_model": entry.get("model"),
+            "shapes_api_key": entry.get("api_key"),
+            "admin_password": entry.get("admin_password"),
+            "access_file": entry.get("access_file", f"approved_chats_{bot_id}.json"),
+        })
+    
+    logger.info(f"Loaded {len(configs)} of {len(entries)} bots from {BOTS_FILE} (shard {SHARD_INDEX}/{SHARD_COUNT})")
+    return configs
+
+async def run_supervisor():
+    """Run the bots and the status server until a shutdown signal is received."""
+    # Imported here so the environment checks below fail fast without loading the bot
+    import bot
+    from status_server import StatusServer
+
+    applications = [bot.build_application(**config) for config in load_bot_configs()]
+    started = []
+    running = []
+    status_server = StatusServer(
+        port=HTTP_PORT,
+        stats=lambda: {
+            "bots": len(running),
+            "failed_bots": len(applications) - len(running),
+            "in_flight_generations": bot.in_flight_generations,
+        }
+    )
+
+    # Stop on SIGINT/SIGTERM instead of dying mid-reply
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    async def start_bot(application):
+        try:
+            await application.initialize()
+            started.append(application)
+            await application.start()
+            await application.updater.start_polling()
+            running.append(application)
+        except Exception as e:
+            # A revoked or invalid token must not take down the other bots in this shard
+            bot_id = application.bot.token.split(":", 1)[0]
+            logger.error(f"Failed to start bot {bot_id}, continuing without it: {e}")
+
+    await status_server.start()
     try:
-        # Run the main.py script directly
-        # Using os.execv to replace the current process with main.py
-        os.execv("/usr/bin/python3", ["python3", "main.py"])
-    except Exception as e:
-        logger.error(f"Failed to start Telegram bot: {e}")
+        # Start all bots concurrently so startup time doesn't grow with the number of bots
+        logger.info(f"Starting {len(applications)} Telegram bot(s)...")
+        await asyncio.gather(*(start_bot(application) for application in applications))
+        if not running:
+            logger.error("No Telegram bot could be started.")
+            return
+        status_server.state = "running"
+        logger.info(f"{len(running)} of {len(applications)} Telegram bot(s) running.")
+
+        await stop_event.wait()
+
+        # Stop fetching updates, then let in-flight replies finish
+        logger.info("Shutting down, draining in-flight replies...")
+        status_server.state = "draining"
+        for application in started:
+            if application.updater.running:
+                await application.updater.stop()
+        if not await bot.drain_generations(DRAIN_TIMEOUT):
+            logger.warning(f"{bot.in_flight_generations} replies still in flight after {DRAIN_TIMEOUT}s")
+    finally:
+        for application in started:
+            try:
+                if application.running:
+                    await application.stop()
+                await application.shutdown()
+            except Exception as e:
+                logger.error(f"Error shutting down a bot: {e}")
+        await status_server.stop()
+
+    logger.info("Shutdown complete.")
 
 if __name__ == "__main__":
     # Check environment variables
     telegram_token = os.environ.get("TELEGRAM_TOKEN")
     shapes_api_key = os.environ.get("SHAPES_API_KEY")
-    
-    if not telegram_token:
-        logger.error("TELEGRAM_TOKEN not found in environment variables")
+
+    if not telegram_token and not os.environ.get("BOTS_FILE"):
+        logger.error("TELEGRAM_TOKEN (or BOTS_FILE) not found in environment variables")
         exit(1)
-    
+
     if not shapes_api_key:
         logger.error("SHAPES_API_KEY not found in environment variables")
         exit(1)
-    
-    # Start the HTTP server in a separate thread
-    http_thread = threading.Thread(target=run_http_server)
-    http_thread.daemon = True  # Make thread a daemon so it exits when main thread exits
-    http_thread.start()
-    
-    # Give the HTTP server a moment to start
-    time.sleep(2)
-    
-    # Run the Telegram bot in the main thread
-    run_telegram_bot()
\ No newline at end of file
+
+    asyncio.run(run_supervisor())
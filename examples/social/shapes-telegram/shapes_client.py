@@ -1,38 +1,67 @@
 import logging
+import threading
 import time
-from typing import Dict, List, Optional
-
-import openai
-from openai import OpenAI
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 from config import (
     SHAPES_API_KEY,
     SHAPES_API_BASE,
     SHAPES_MODEL,
+    SHAPES_MAX_CONNECTIONS,
     REQUEST_TIMEOUT
 )
 
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
+
 logger = logging.getLogger(__name__)
 
 class RateLimitExceeded(Exception):
     """Exception raised when the API rate limit is exceeded."""
     pass
 
+@lru_cache(maxsize=None)
+def get_shared_http_client() -> "httpx.Client":
+    """
+    Get the HTTP connection pool shared by every ShapesClient in the process.
+    
+    Bots hosted in the same process reuse these keep-alive connections to the
+    Shapes API instead of each opening their own pool.
+    """
+    import httpx
+    from openai import DefaultHttpxClient
+    
+    return DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=SHAPES_MAX_CONNECTIONS,
+            max_keepalive_connections=SHAPES_MAX_CONNECTIONS
+        )
+    )
+
 class ShapesClient:
     """Client for interacting with the Shapes Inc API using OpenAI API compatibility."""
     
-    def __init__(self):
-        self.api_key = SHAPES_API_KEY
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None):
+        """
+        Initialize the Shapes client.
+        
+        Args:
+            model: The Shapes model to use (defaults to SHAPES_MODEL)
+            api_key: The Shapes API key to use (defaults to SHAPES_API_KEY)
+        """
+        self.api_key = api_key or SHAPES_API_KEY
         self.api_base = SHAPES_API_BASE
-        self.model = SHAPES_MODEL
+        self.model = model or SHAPES_MODEL
         self.last_request_time = 0
         self.min_request_interval = 1  # Minimum time between requests in seconds
+        # generate_response runs on worker threads (asyncio.to_thread), so the rate
+        # limiter state and the lazily created client are guarded by this lock
+        self._lock = threading.Lock()
         
-        # Initialize the OpenAI client with Shapes settings
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base
-        )
+        # The OpenAI client is created on first request (see the client property)
+        self._client: Optional["OpenAI"] = None
         
         # Log some info about the configuration
         logger.info(f"Initialized Shapes client with model: {self.model}")
@@ -45,6 +74,20 @@ class ShapesClient:
         masked_key = "****" + self.api_key[-4:] if self.api_key and len(self.api_key) > 4 else "NOT SET"
         logger.info(f"Using Shapes API key: {masked_key}")
     
+    @property
+    def client(self) -> "OpenAI":
+        """The OpenAI client configured for Shapes, created on first use to keep startup fast."""
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                
+                self._client = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.api_base,
+                    http_client=get_shared_http_client()
+                )
+            return self._client
+    
     def generate_response(self, 
                          conversation_history: List[Dict[str, str]], 
                          system_prompt: Optional[str] = None,
@@ -66,12 +109,17 @@ class ShapesClient:
             RateLimitExceeded: If the API rate limit is exceeded
             Exception: For other API errors
         """
-        # Rate limiting
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
+        import openai
+        
+        # Rate limiting: reserve the next request slot under the lock, then sleep
+        # outside it so concurrent requests are spaced out rather than serialized
+        with self._lock:
+            current_time = time.time()
+            request_time = max(current_time, self.last_request_time + self.min_request_interval)
+            self.last_request_time = request_time
         
-        if time_since_last_request < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last_request
+        sleep_time = request_time - current_time
+        if sleep_time > 0:
             logger.debug(f"Rate limiting: Sleeping for {sleep_time:.2f} seconds")
             time.sleep(sleep_time)
         
@@ -79,7 +127,6 @@ class ShapesClient:
         messages = conversation_history
         
         logger.debug(f"Sending request to Shapes API with {len(messages)} messages")
-        self.last_request_time = time.time()
         
         try:
             # Set up headers for user identification and conversation context
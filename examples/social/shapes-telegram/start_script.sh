@@ -1,8 +1,5 @@
 #!/bin/bash
 
 # Extremely simple script for Replit deployment
-# Start the simple HTTP server on port 5000 in the background
-python -m http.server 5000 &
-
-# Run the Telegram bot in the foreground
-exec python main.py
\ No newline at end of file
+# run.py serves the status page on port 5000 and runs the Telegram bot in one process
+exec python run.py
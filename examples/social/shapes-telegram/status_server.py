@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+
+class StatusServer:
+    """
+    Minimal HTTP status server that runs on the bot's own event loop.
+
+    Serves the static status page at / and a health check at /health, so the
+    deployment only needs one process for both the bot and its web endpoint.
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 5000,
+                 stats: Optional[Callable[[], Dict[str, int]]] = None):
+        """
+        Initialize the status server.
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on
+            stats: Optional callable returning extra counters for /health
+        """
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.state = "starting"  # starting -> running -> draining
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        with open(STATUS_PAGE, "rb") as f:
+            self._page = f.read()
+
+    async def start(self) -> None:
+        """Start accepting connections."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Status server listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """Stop accepting connections and close the listening socket."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("Status server stopped")
+
+    def _route(self, path: str) -> Tuple[int, str, bytes]:
+        """Build the (status code, content type, body) for a request path."""
+        if path == "/health":
+            body = {"status": self.state}
+            if self.stats:
+                body.update(self.stats())
+            code = 200 if self.state == "running" else 503
+            return code, "application/json", json.dumps(body).encode()
+
+        if path in ("/", "/index.html"):
+            return 200, "text/html; charset=utf-8", self._page
+
+        return 404, "text/plain", b"Not Found"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer a single HTTP request and close the connection."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers, we don't need any of them
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else "/"
+            code, content_type, body = self._route(path)
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[code]
+
+            head = (
+                f"HTTP/1.1 {code} {reason}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode("latin-1"))
+            if parts and parts[0] != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Status server connection error: {str(e)}")
+        finally:
+            writer.close()
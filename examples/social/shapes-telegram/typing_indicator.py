@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from telegram import Bot
+from telegram.constants import ChatAction
+
+from config import TYPING_REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+class TypingIndicator:
+    """Keeps the "typing..." chat action alive while replies are being generated."""
+
+    def __init__(self, interval: float = TYPING_REFRESH_INTERVAL):
+        """
+        Initialize the typing indicator.
+
+        Args:
+            interval: Seconds between chat actions for the same chat. Telegram
+                clears the indicator after roughly 5 seconds, so this should stay below that.
+        """
+        self.interval = interval
+
+        # Last time a chat action was sent, per chat (monotonic clock)
+        # Shared by every generation in a chat so concurrent replies don't double up requests
+        self.last_sent: Dict[int, float] = {}
+
+    @asynccontextmanager
+    async def keep_typing(self, bot: Bot, chat_id: int, message_thread_id: Optional[int] = None) -> AsyncIterator[None]:
+        """
+        Show "typing..." in a chat for as long as the context is active.
+
+        The chat action is sent from a background task, so entering the context
+        never waits on Telegram. The task is cancelled as soon as the context exits.
+
+        Args:
+            bot: The Telegram bot instance
+            chat_id: The chat to show the indicator in
+            message_thread_id: The thread ID if the message is in a thread
+        """
+        task = asyncio.create_task(self._refresh(bot, chat_id, message_thread_id))
+        try:
+            yield
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _refresh(self, bot: Bot, chat_id: int, message_thread_id: Optional[int]) -> None:
+        """Send the typing chat action every interval until cancelled."""
+        while True:
+            elapsed = time.monotonic() - self.last_sent.get(chat_id, 0.0)
+
+            if elapsed >= self.interval:
+                self.last_sent[chat_id] = time.monotonic()
+                try:
+                    await bot.send_chat_action(
+                        chat_id=chat_id,
+                        action=ChatAction.TYPING,
+                        message_thread_id=message_thread_id
+                    )
+                except Exception as e:
+                    # Typing indicators are cosmetic, never let them break a reply
+                    logger.debug(f"Failed to send typing indicator to chat {chat_id}: {str(e)}")
+                elapsed = 0.0
+
+            await asyncio.sleep(self.interval - elapsed)